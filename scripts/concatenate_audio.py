@@ -9,13 +9,6 @@ from pathlib import Path
 # Add src to path for development
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from concatenator.audio import (
-    concatenate_audio,
-    organize_samples,
-    generate_companion_midi,
-)
-from concatenator.scales import load_scales_data
-
 
 def parse_args(argv=None):
     parser = argparse.ArgumentParser(
@@ -108,6 +101,8 @@ def parse_args(argv=None):
 
 def cmd_organize(args):
     """Handle the organize command."""
+    from concatenator.audio import organize_samples
+
     transpositions = tuple(int(x) for x in args.transpositions.split(","))
 
     output_dir = organize_samples(
@@ -125,6 +120,9 @@ def cmd_organize(args):
 
 def cmd_chain(args):
     """Handle the chain command."""
+    from concatenator.audio import concatenate_audio, generate_companion_midi
+    from concatenator.scales import load_scales_data
+
     output_path, journey = concatenate_audio(
         scales_dir=args.scales_dir,
         sample_prefix=args.prefix,
@@ -9,19 +9,6 @@ from pathlib import Path
 # Add src to path for development
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
-from concatenator.midi import (
-    get_filelist,
-    load_or_build_analysis,
-    build_connections,
-    prune_sinks,
-    build_non_sink_children,
-    random_walk,
-    render_graph,
-    export_lilypond,
-    export_musicxml,
-    show_musicxml,
-)
-
 
 def parse_args(argv=None):
     parser = argparse.ArgumentParser(
@@ -41,23 +28,120 @@ def parse_args(argv=None):
     parser.add_argument(
         "--graph",
         action="store_true",
-        help="render a Graphviz graph of progression connections",
+        help="write the progression graph without layout to --graph-path",
+    )
+    parser.add_argument(
+        "--graph-path",
+        default="outputs/graphs/graph.dot",
+        metavar="PATH",
+        help="where --graph writes, as DOT (.dot/.gv), GraphML (.graphml) or a "
+        "tab-separated edge list (.tsv) (default: outputs/graphs/graph.dot)",
+    )
+    parser.add_argument(
+        "--graph-hops",
+        type=int,
+        metavar="K",
+        help="with --graph, only write progressions within K connections of the start",
+    )
+    parser.add_argument(
+        "--graph-condense",
+        action="store_true",
+        help="with --graph, write the strongly connected components as single nodes",
+    )
+    parser.add_argument(
+        "--graph-render",
+        action="store_true",
+        help="with --graph and a DOT --graph-path, also lay it out and render it to PDF "
+        "with Graphviz once the walk is done",
     )
     parser.add_argument(
         "--no-play",
         action="store_true",
         help="disable realtime MIDI playback while generating progressions",
     )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=4,
+        help="progressions computed ahead of realtime playback (default: 4)",
+    )
+    parser.add_argument(
+        "--no-steer",
+        action="store_true",
+        help="don't steer the walk back to the start progression (may not close the loop)",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="collapse progressions that are copies or transpositions of each other into "
+        "one node (the walk picks among them when rendering)",
+    )
+    parser.add_argument(
+        "--match",
+        choices=["intervals", "chord-type"],
+        default="intervals",
+        help="connect progressions by matching interval patterns (default) or by "
+        "bass-relative pitch-class set",
+    )
+    parser.add_argument(
+        "--match-tolerance",
+        type=int,
+        default=0,
+        metavar="K",
+        help="also connect interval patterns that differ by up to K semitones per interval",
+    )
+    parser.add_argument(
+        "--max-voice-leading",
+        type=int,
+        metavar="SEMITONES",
+        help="drop connections whose voice-leading distance (total semitone motion "
+        "across the join) is larger than this",
+    )
+    parser.add_argument(
+        "--weighted",
+        action="store_true",
+        help="prefer transitions with smooth voice leading (weighted by the graph's "
+        "edge weights instead of uniform)",
+    )
+    parser.add_argument(
+        "--dataset-weight",
+        action="append",
+        default=[],
+        metavar="NAME=FACTOR",
+        help="multiply the weight of transitions into a dataset (e.g. reger=2); "
+        "implies --weighted, may be repeated",
+    )
+    parser.add_argument(
+        "--bank",
+        action="store_true",
+        help="render from a precompiled progression bank (compiled on first use)",
+    )
     parser.add_argument(
         "--seed",
         type=int,
         help="random seed for reproducible walks",
     )
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=1,
+        help="number of walks to generate; more than 1 writes each walk plus a "
+        "summary.json into the output directory (-o) without playback",
+    )
+    parser.add_argument(
+        "--walk-jobs",
+        type=int,
+        default=1,
+        metavar="J",
+        help="worker processes rendering the --count walks (1 = serial, 0 = one per CPU "
+        "core); corpus analysis uses --workers",
+    )
     parser.add_argument(
         "--output-format",
-        choices=["lilypond", "musicxml", "show"],
+        choices=["lilypond", "musicxml", "midi", "show"],
         default="lilypond",
-        help="output format: lilypond (default), musicxml, or show (opens in viewer)",
+        help="output format: lilypond (default), musicxml, midi (fast, no score), "
+        "or show (opens in viewer)",
     )
     parser.add_argument(
         "-o",
@@ -70,12 +154,91 @@ def parse_args(argv=None):
         default=Path(__file__).parent.parent / "datasets",
         help="directory containing MIDI datasets",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=Path("."),
+        help="directory for the analysis store, graph and progression bank caches "
+        "(default: current directory)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes for corpus analysis and bank compilation (1 = serial, "
+        "0 = one per CPU core); --count walks use --walk-jobs",
+    )
+    parser.add_argument(
+        "--analysis-backend",
+        choices=["fast", "music21", "verify"],
+        default="fast",
+        help="boundary-chord extraction: fast raw-MIDI reader (default), music21 chordify, "
+        "or verify (run both and report disagreements)",
+    )
     return parser.parse_args(argv)
 
 
+def announce_steps(steps, playback=None):
+    """Print each walk step's name (and play it) as it is generated."""
+    for step in steps:
+        print(step.name)
+        if playback is not None:
+            playback.submit(step)
+        yield step
+
+
+def render_graph_file(graph_path):
+    """Lay out the exported DOT graph, warning instead of failing if Graphviz can't."""
+    from concatenator.midi import render_dot
+
+    try:
+        render_dot(graph_path)
+    except Exception as e:
+        print(f"Warning: could not render {graph_path} with Graphviz ({e}).")
+
+
 def main(argv=None):
     args = parse_args(argv)
 
+    graph_options = args.graph_hops is not None or args.graph_condense or args.graph_render
+    if graph_options and not args.graph:
+        raise SystemExit("--graph-hops, --graph-condense and --graph-render need --graph.")
+    if args.graph_render and Path(args.graph_path).suffix.lower() not in (".dot", ".gv"):
+        raise SystemExit("--graph-render needs a DOT (.dot or .gv) --graph-path.")
+    if args.match_tolerance < 0:
+        raise SystemExit("--match-tolerance must be 0 or more.")
+    if args.prefetch < 1:
+        raise SystemExit("--prefetch must be 1 or more.")
+
+    # imported after argument parsing so --help and usage errors stay fast;
+    # concatenator.midi itself loads music21 and graphviz only where needed
+    from concatenator.midi import (
+        get_filelist,
+        resolve_start,
+        load_or_build_analysis,
+        load_or_build_graph,
+        load_or_compile_bank,
+        collapse_duplicates,
+        dataset_walk_weights,
+        parse_dataset_weights,
+        generate_walks,
+        iter_walk,
+        random_walk,
+        RealtimePlayback,
+        export_condensation,
+        export_graph,
+        neighborhood,
+        export_lilypond,
+        export_musicxml,
+        export_midi,
+        show_musicxml,
+    )
+
+    try:
+        factors = parse_dataset_weights(args.dataset_weight)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
     if args.seed is not None:
         random.seed(args.seed)
 
@@ -87,27 +250,18 @@ def main(argv=None):
     if not filelist:
         raise SystemExit(f"No .mid or .midi files found under {datasets_dir}")
 
-    # Resolve start path
-    start_path = args.start
-    if not Path(start_path).is_absolute():
-        # Try to find it in datasets
-        candidates = [f for f in filelist if start_path in f]
-        if len(candidates) == 1:
-            start_path = candidates[0]
-        elif len(candidates) > 1:
-            # Prefer exact match
-            exact = [f for f in candidates if f.endswith(start_path)]
-            if exact:
-                start_path = exact[0]
-            else:
-                print(f"Multiple matches for '{start_path}':")
-                for c in candidates[:10]:
-                    print(f"  {c}")
-                raise SystemExit("Please specify a more precise path.")
-        else:
-            raise SystemExit(f"Start file '{start_path}' not found in datasets.")
+    try:
+        start_path = resolve_start(filelist, args.start)
+    except ValueError as e:
+        raise SystemExit(str(e))
 
-    arr_dict = load_or_build_analysis(filelist)
+    args.cache_dir.mkdir(parents=True, exist_ok=True)
+    arr_dict = load_or_build_analysis(
+        filelist,
+        analysis_path=args.cache_dir / "analysis.store",
+        workers=args.workers,
+        backend=args.analysis_backend,
+    )
 
     if start_path not in arr_dict:
         raise SystemExit(
@@ -115,29 +269,112 @@ def main(argv=None):
             "(it may have no chords or failed to parse)."
         )
 
-    build_connections(arr_dict)
+    if args.dedupe:
+        total = len(arr_dict)
+        arr_dict = collapse_duplicates(arr_dict)
+        print(f"Collapsed {total} progressions into {len(arr_dict)} distinct nodes.")
+
+    graph = load_or_build_graph(
+        arr_dict,
+        graph_path=args.cache_dir / "graph.npz",
+        max_voice_leading=args.max_voice_leading,
+        tolerance=args.match_tolerance,
+        match=args.match,
+    )
 
+    graph_path = None
     if args.graph:
-        render_graph(arr_dict)
+        # written without layout, so this stays quick even for the full corpus
+        if args.graph_condense:
+            graph_path = export_condensation(graph, args.graph_path)
+        elif args.graph_hops is not None:
+            nodes = neighborhood(graph, graph.node_id(start_path), args.graph_hops)
+            graph_path = export_graph(graph, args.graph_path, nodes=nodes)
+        else:
+            graph_path = export_graph(graph, args.graph_path)
 
-    prune_sinks(arr_dict)
-    build_non_sink_children(arr_dict)
+    if factors:
+        graph.set_walk_weights(dataset_walk_weights(graph, factors))
+        args.weighted = True
 
-    part_with_measures = random_walk(
-        arr_dict,
-        start_name=start_path,
-        target_progressions=args.num,
-        enable_playback=not args.no_play,
-    )
+    bank = None
+    if args.bank:
+        bank = load_or_compile_bank(
+            graph.rendered_names(),
+            bank_path=args.cache_dir / "progressions.bank",
+            workers=args.workers,
+        )
+
+    if args.count > 1:
+        if args.output_format == "show":
+            raise SystemExit("--count needs a file output format (lilypond, musicxml or midi).")
+        generate_walks(
+            graph,
+            start_path,
+            args.count,
+            target_progressions=args.num,
+            seed=args.seed,
+            jobs=args.walk_jobs,
+            output_dir=args.output or "outputs/scores/batch",
+            output_format=args.output_format,
+            steer=not args.no_steer,
+            bank_path=bank.path if bank is not None else None,
+            weighted=args.weighted,
+        )
+        if args.graph_render:
+            render_graph_file(graph_path)
+        return
+
+    playback = None if args.no_play else RealtimePlayback(prefetch=args.prefetch)
+
+    if args.output_format == "midi":
+        # straight from the note events: no Part, measures or ties
+        steps = iter_walk(
+            graph,
+            start_path,
+            target_progressions=args.num,
+            steer=not args.no_steer,
+            bank=bank,
+            weighted=args.weighted,
+        )
+        finished = False
+        try:
+            export_midi(announce_steps(steps, playback), args.output)
+            finished = True
+        finally:
+            # don't leave the playback thread and MIDI port open on errors or Ctrl-C
+            if playback is not None:
+                playback.close(wait=finished)
+    else:
+        part_with_measures = random_walk(
+            graph,
+            start_name=start_path,
+            target_progressions=args.num,
+            enable_playback=not args.no_play,
+            steer=not args.no_steer,
+            bank=bank,
+            playback=playback,
+            weighted=args.weighted,
+        )
+
+    if playback is not None and playback.underruns:
+        print(
+            f"Playback: {playback.underruns} underrun(s), "
+            f"{playback.underrun_seconds:.2f}s of silence between progressions"
+        )
 
     # Handle output
     if args.output_format == "lilypond":
         export_lilypond(part_with_measures, args.output)
     elif args.output_format == "musicxml":
         export_musicxml(part_with_measures, args.output)
-    else:  # show
+    elif args.output_format == "show":
         show_musicxml(part_with_measures)
 
+    # the layout is the slow part, so it waits until the walk is out
+    if args.graph_render:
+        render_graph_file(graph_path)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""CLI for structural analytics of the progression graph."""
+
+import argparse
+import contextlib
+import json
+import sys
+from pathlib import Path
+
+# Add src to path for development
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report strongly connected components, degree distributions and the "
+        "stationary distribution of walks over the progression graph, as JSON."
+    )
+    parser.add_argument(
+        "--start",
+        help="starting MIDI filename (relative path under datasets directory); adds "
+        "reachability from it and starts the stationary walk there",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="number of most visited progressions and largest components to list (default: 20)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="write the JSON report here instead of to stdout",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="collapse progressions that are copies or transpositions of each other",
+    )
+    parser.add_argument(
+        "--match",
+        choices=["intervals", "chord-type"],
+        default="intervals",
+        help="connect progressions by matching interval patterns (default) or by "
+        "bass-relative pitch-class set",
+    )
+    parser.add_argument(
+        "--match-tolerance",
+        type=int,
+        default=0,
+        metavar="K",
+        help="also connect interval patterns that differ by up to K semitones per interval",
+    )
+    parser.add_argument(
+        "--max-voice-leading",
+        type=int,
+        metavar="SEMITONES",
+        help="drop connections whose voice-leading distance is larger than this",
+    )
+    parser.add_argument(
+        "--weighted",
+        action="store_true",
+        help="compute the stationary distribution of weighted walks",
+    )
+    parser.add_argument(
+        "--dataset-weight",
+        action="append",
+        default=[],
+        metavar="NAME=FACTOR",
+        help="multiply the weight of transitions into a dataset (e.g. reger=2); "
+        "implies --weighted, may be repeated",
+    )
+    parser.add_argument(
+        "--datasets-dir",
+        type=Path,
+        default=Path(__file__).parent.parent / "datasets",
+        help="directory containing MIDI datasets",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=Path("."),
+        help="directory for the analysis store and graph caches (default: current directory)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes for corpus analysis (1 = serial, 0 = one per CPU core)",
+    )
+    return parser.parse_args(argv)
+
+
+def load_graph(args):
+    """Analyze the corpus and load (or build) its graph, as concatenate_midi.py does."""
+    from concatenator.midi import (
+        collapse_duplicates,
+        dataset_walk_weights,
+        get_filelist,
+        load_or_build_analysis,
+        load_or_build_graph,
+        parse_dataset_weights,
+        resolve_start,
+    )
+
+    datasets_dir = args.datasets_dir.resolve()
+    if not datasets_dir.exists():
+        raise SystemExit(f"Datasets directory not found: {datasets_dir}")
+    filelist = get_filelist(datasets_dir)
+    if not filelist:
+        raise SystemExit(f"No .mid or .midi files found under {datasets_dir}")
+
+    try:
+        factors = parse_dataset_weights(args.dataset_weight)
+        start = resolve_start(filelist, args.start) if args.start is not None else None
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    args.cache_dir.mkdir(parents=True, exist_ok=True)
+    arr_dict = load_or_build_analysis(
+        filelist, analysis_path=args.cache_dir / "analysis.store", workers=args.workers
+    )
+    if args.dedupe:
+        arr_dict = collapse_duplicates(arr_dict)
+    graph = load_or_build_graph(
+        arr_dict,
+        graph_path=args.cache_dir / "graph.npz",
+        max_voice_leading=args.max_voice_leading,
+        tolerance=args.match_tolerance,
+        match=args.match,
+    )
+    if start is not None and start not in graph:
+        raise SystemExit(f"Start file '{start}' is not in the graph.")
+
+    if factors:
+        graph.set_walk_weights(dataset_walk_weights(graph, factors))
+        args.weighted = True
+
+    return graph, start
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # keep progress messages out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        graph, start = load_graph(args)
+
+    from concatenator.midi import graph_report
+
+    report = graph_report(graph, start=start, weighted=args.weighted, top=args.top)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text + "\n")
+        print(f"Graph report written to: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,31 +4,38 @@ This module provides tools for:
 - Organizing audio samples into scale folders (sample_clerk)
 - Chaining samples via the Tymoczko 57-scale network (chain)
 - Generating companion MIDI tracks
+
+Names are loaded from their submodules on first access (PEP 562), so
+pydub is only imported once audio code is actually used.
 """
 
-from .sample_clerk import (
-    organize_samples,
-    transpose_audio,
-    normalize_audio,
-    load_samples_manifest,
-)
-
-from .chain import (
-    concatenate_audio,
-    find_initial_samples,
-    find_next_samples,
-    generate_companion_midi,
-)
-
-__all__ = [
+import importlib
+
+# public name -> submodule that defines it
+_EXPORTS = {
     # sample_clerk
-    "organize_samples",
-    "transpose_audio",
-    "normalize_audio",
-    "load_samples_manifest",
+    "organize_samples": "sample_clerk",
+    "transpose_audio": "sample_clerk",
+    "normalize_audio": "sample_clerk",
+    "load_samples_manifest": "sample_clerk",
     # chain
-    "concatenate_audio",
-    "find_initial_samples",
-    "find_next_samples",
-    "generate_companion_midi",
-]
+    "concatenate_audio": "chain",
+    "find_initial_samples": "chain",
+    "find_next_samples": "chain",
+    "generate_companion_midi": "chain",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
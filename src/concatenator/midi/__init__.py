@@ -1,22 +1,101 @@
-"""MIDI concatenation module."""
-
-from .analyzer import build_intervals, get_parsed, get_filelist, load_or_build_analysis
-from .graph import build_connections, mark_sinks, prune_sinks, build_non_sink_children
-from .walker import random_walk, add_ties_for_repeated_notes
-from .output import render_graph, export_lilypond, export_musicxml
-
-__all__ = [
-    "build_intervals",
-    "get_parsed",
-    "get_filelist",
-    "load_or_build_analysis",
-    "build_connections",
-    "mark_sinks",
-    "prune_sinks",
-    "build_non_sink_children",
-    "random_walk",
-    "add_ties_for_repeated_notes",
-    "render_graph",
-    "export_lilypond",
-    "export_musicxml",
-]
+"""MIDI concatenation module.
+
+Names are loaded from their submodules on first access (PEP 562), so
+importing the package stays cheap: music21 is only imported by the code
+paths that parse or build scores, and graphviz only by ``render_graph``.
+"""
+
+import importlib
+
+# public name -> submodule that defines it
+_EXPORTS = {
+    # analyzer
+    "build_intervals": "analyzer",
+    "build_intervals_from_midi": "analyzer",
+    "get_parsed": "analyzer",
+    "ParsedStreamCache": "analyzer",
+    "configure_parsed_cache": "analyzer",
+    "clear_parsed_cache": "analyzer",
+    "parsed_cache_stats": "analyzer",
+    "get_filelist": "analyzer",
+    "resolve_start": "analyzer",
+    "analyze_file": "analyzer",
+    "analyze_files": "analyzer",
+    "load_or_build_analysis": "analyzer",
+    # store
+    "AnalysisStore": "store",
+    "write_analysis_store": "store",
+    # graph
+    "build_connections": "graph",
+    "chord_type": "graph",
+    "collapse_duplicates": "graph",
+    "mark_sinks": "graph",
+    "prune_sinks": "graph",
+    "build_non_sink_children": "graph",
+    # compact
+    "ProgressionGraph": "compact",
+    "analysis_fingerprint": "compact",
+    "load_or_build_graph": "compact",
+    "dataset_walk_weights": "compact",
+    "parse_dataset_weights": "compact",
+    "default_walk_weights": "compact",
+    "drop_rough_connections": "compact",
+    "voice_leading_distance": "compact",
+    # analytics
+    "graph_report": "analytics",
+    "strongly_connected_components": "analytics",
+    "closed_components": "analytics",
+    "condensation": "analytics",
+    "neighborhood": "analytics",
+    "reachable_from": "analytics",
+    "stationary_distribution": "analytics",
+    "transition_probabilities": "analytics",
+    # bank
+    "ProgressionBank": "bank",
+    "compile_bank": "bank",
+    "load_or_compile_bank": "bank",
+    # batch
+    "WalkBatch": "batch",
+    "batch_walks": "batch",
+    "walk_bounds": "batch",
+    "walk_transpositions": "batch",
+    # playback
+    "RealtimePlayback": "playback",
+    "Music21Player": "playback",
+    "NullPlayer": "playback",
+    # walker
+    "WalkStep": "walker",
+    "iter_walk": "walker",
+    "random_walk": "walker",
+    "add_ties_for_repeated_notes": "walker",
+    "tie_repeated_notes": "walker",
+    # pool
+    "generate_walks": "pool",
+    "walk_seeds": "pool",
+    # output
+    "render_graph": "output",
+    "export_graph": "output",
+    "export_condensation": "output",
+    "render_dot": "output",
+    "export_lilypond": "output",
+    "export_musicxml": "output",
+    "export_midi": "output",
+    "merge_tied_notes": "output",
+    "show_musicxml": "output",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    # cache it so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,347 @@
+"""Structural analytics for a ProgressionGraph.
+
+Everything here works on the graph's walk edges (non-sink, non-self
+children) straight from the CSR arrays, so a report on the full corpus
+takes well under a second instead of hundreds of sampled walks:
+
+- strongly connected components (iterative Tarjan), including the
+  *closed* ones a walk can enter but never leave, the condensation they
+  form, and reachability from a starting progression
+- in/out degree distributions
+- the stationary distribution of an endless walk, by sparse power
+  iteration, i.e. how often a long walk visits each progression
+
+:func:`neighborhood` picks out the progressions within a few connections
+of one, for exporting a readable subgraph.
+"""
+
+import os
+from collections import Counter
+
+import numpy as np
+
+
+def strongly_connected_components(graph):
+    """Label each node with its strongly connected component over the walk edges.
+
+    Iterative Tarjan, so deep graphs don't hit the recursion limit.
+    Components are numbered in the order Tarjan completes them, which is a
+    reverse topological order of the condensation: every walk edge between
+    two components leads from a higher label to a lower one.
+
+    Returns:
+        ``(labels, count)``: an int32 array of component ids, one per node,
+        and the number of components
+    """
+    n = len(graph)
+    ptr = graph.walk_ptr.tolist()
+    children = graph.walk_children.tolist()
+
+    index = [-1] * n
+    lowlink = [0] * n
+    on_stack = [False] * n
+    stack = []
+    labels = np.full(n, -1, dtype=np.int32)
+    count = 0
+    counter = 0
+
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        # DFS frames: (node, position of the next edge to follow)
+        frames = [(root, ptr[root])]
+        while frames:
+            node, pos = frames[-1]
+            if pos < ptr[node + 1]:
+                frames[-1] = (node, pos + 1)
+                child = children[pos]
+                if index[child] < 0:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack[child] = True
+                    frames.append((child, ptr[child]))
+                elif on_stack[child]:
+                    lowlink[node] = min(lowlink[node], index[child])
+                continue
+
+            frames.pop()
+            if frames:
+                parent = frames[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    labels[member] = count
+                    if member == node:
+                        break
+                count += 1
+
+    return labels, count
+
+
+def closed_components(graph, labels, count):
+    """Flag the components a walk can enter but never leave.
+
+    A component is closed when it has walk edges inside it and none
+    leading out. Dead ends (nodes without walk edges) don't count: the
+    walker jumps anywhere from them.
+
+    Returns:
+        Boolean array indexed by component id
+    """
+    rows = np.repeat(np.arange(len(graph)), np.diff(graph.walk_ptr))
+    leaving = labels[rows] != labels[graph.walk_children]
+    closed = np.zeros(count, dtype=bool)
+    closed[labels[rows[~leaving]]] = True
+    closed[labels[rows[leaving]]] = False
+    return closed
+
+
+def condensation(graph, labels=None, count=None):
+    """Collapse each strongly connected component into a single node.
+
+    Args:
+        graph: ProgressionGraph
+        labels, count: Components from strongly_connected_components
+            (computed if not given)
+
+    Returns:
+        ``(labels, count, sources, targets, edge_counts)``: the component
+        of each node, the number of components, and the condensation's
+        edges as parallel arrays, each with the number of walk edges it
+        stands for
+    """
+    if labels is None:
+        labels, count = strongly_connected_components(graph)
+    rows = np.repeat(np.arange(len(graph)), np.diff(graph.walk_ptr))
+    src, dst = labels[rows], labels[graph.walk_children]
+    between = src != dst
+    pairs, edge_counts = np.unique(
+        src[between].astype(np.int64) * count + dst[between], return_counts=True
+    )
+    return labels, count, pairs // count, pairs % count, edge_counts
+
+
+def neighborhood(graph, node_id, hops, direction="both"):
+    """Ids of the nodes within ``hops`` edges of ``node_id``.
+
+    Follows all connections (``children``/``parents``, sinks included),
+    so the result matches what an exported subgraph shows.
+
+    Args:
+        graph: ProgressionGraph
+        node_id: Center node
+        hops: Maximum number of edges from the center
+        direction: "out" (children), "in" (parents) or "both"
+
+    Returns:
+        Sorted int array of node ids, including ``node_id``
+    """
+    if direction not in ("out", "in", "both"):
+        raise ValueError(f"Unknown direction: {direction}")
+    seen = {node_id}
+    frontier = [node_id]
+    for _ in range(hops):
+        reached = []
+        for node in frontier:
+            if direction != "in":
+                reached.extend(graph.children_of(node).tolist())
+            if direction != "out":
+                reached.extend(graph.parents_of(node).tolist())
+        frontier = [node for node in set(reached) if node not in seen]
+        if not frontier:
+            break
+        seen.update(frontier)
+    return np.array(sorted(seen), dtype=np.int64)
+
+
+def reachable_from(graph, node_id):
+    """Boolean array marking the nodes a walk from ``node_id`` can reach."""
+    seen = np.zeros(len(graph), dtype=bool)
+    seen[node_id] = True
+    frontier = [node_id]
+    while frontier:
+        node = frontier.pop()
+        for child in graph.walk_children_of(node).tolist():
+            if not seen[child]:
+                seen[child] = True
+                frontier.append(child)
+    return seen
+
+
+def transition_probabilities(graph, weighted=False):
+    """Per-walk-edge transition probabilities of the unsteered walk.
+
+    Args:
+        graph: ProgressionGraph
+        weighted: Follow ``graph.walk_weights`` (as ``--weighted`` walks do)
+            instead of picking children uniformly; rows whose weights are
+            all zero fall back to uniform
+
+    Returns:
+        Float array parallel to ``graph.walk_children``
+    """
+    degree = np.diff(graph.walk_ptr)
+    rows = np.repeat(np.arange(len(graph)), degree)
+    uniform = 1.0 / degree[rows]
+    if not weighted:
+        return uniform
+    totals = np.bincount(rows, weights=graph.walk_weights, minlength=len(graph))
+    row_total = totals[rows]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        probs = graph.walk_weights / row_total
+    return np.where(row_total > 0, probs, uniform)
+
+
+def stationary_distribution(graph, start=None, weighted=False, tol=1e-12, max_iter=10000):
+    """Long-run share of steps an endless walk spends on each node.
+
+    Models the walk without steering or loop closing (``iter_walk`` with
+    ``close_loop=False``): a step follows a walk edge, and a node without
+    walk edges jumps to any node uniformly, as the walker does at a dead
+    end. Iterates the lazy chain ``x <- (x + xP) / 2``, which has the same
+    stationary distribution but also converges on periodic graphs, using
+    one ``np.bincount`` over the edges per step.
+
+    Args:
+        graph: ProgressionGraph
+        start: Node id the walk starts from (default: uniform over all
+            nodes). On a graph with several closed components the limit
+            depends on where the walk starts.
+        weighted: Use the graph's walk weights (see transition_probabilities)
+        tol: Stop once an iteration moves less than this much mass (L1)
+        max_iter: Iteration cap
+
+    Returns:
+        ``(distribution, iterations, converged)``
+    """
+    n = len(graph)
+    rows = np.repeat(np.arange(n), np.diff(graph.walk_ptr))
+    probs = transition_probabilities(graph, weighted)
+    dead_end = np.diff(graph.walk_ptr) == 0
+
+    if start is None:
+        x = np.full(n, 1.0 / n)
+    else:
+        x = np.zeros(n)
+        x[start] = 1.0
+
+    for iteration in range(1, max_iter + 1):
+        step = np.bincount(graph.walk_children, weights=x[rows] * probs, minlength=n)
+        step += x[dead_end].sum() / n
+        new = 0.5 * (x + step)
+        delta = np.abs(new - x).sum()
+        x = new
+        if delta < tol:
+            return x / x.sum(), iteration, True
+    return x / x.sum(), max_iter, False
+
+
+def _dataset(name):
+    return os.path.basename(os.path.dirname(name))
+
+
+def _degree_summary(degrees):
+    histogram = sorted(Counter(degrees.tolist()).items())
+    return {
+        "min": int(degrees.min()) if len(degrees) else 0,
+        "max": int(degrees.max()) if len(degrees) else 0,
+        "mean": float(degrees.mean()) if len(degrees) else 0.0,
+        "median": float(np.median(degrees)) if len(degrees) else 0.0,
+        "zero": int((degrees == 0).sum()),
+        "histogram": [[int(d), int(c)] for d, c in histogram],
+    }
+
+
+def graph_report(graph, start=None, weighted=False, top=20):
+    """Summarize the walk structure of ``graph`` as a JSON-serializable dict.
+
+    Args:
+        graph: ProgressionGraph
+        start: Optional starting progression (name or duplicate name); adds
+            reachability from it and starts the stationary walk there
+        weighted: Use the graph's walk weights for the stationary distribution
+        top: How many of the most visited progressions to list
+
+    Returns:
+        Dict with ``graph``, ``degrees``, ``components``, ``stationary`` and,
+        with ``start``, ``start`` sections
+    """
+    n = len(graph)
+    start_id = graph.node_id(start) if start is not None else None
+
+    out_degree = np.diff(graph.walk_ptr)
+    in_degree = np.bincount(graph.walk_children, minlength=n)
+
+    labels, count = strongly_connected_components(graph)
+    sizes = np.bincount(labels, minlength=count)
+    closed = closed_components(graph, labels, count)
+    by_size = np.argsort(-sizes, kind="stable")
+
+    distribution, iterations, converged = stationary_distribution(
+        graph, start=start_id, weighted=weighted
+    )
+    visited = distribution[distribution > 0]
+    entropy = float(-(visited * np.log2(visited)).sum())
+    datasets = Counter()
+    for name, p in zip(graph.names, distribution.tolist()):
+        datasets[_dataset(name)] += p
+
+    report = {
+        "graph": {
+            "nodes": n,
+            "edges": len(graph.children),
+            "walk_edges": len(graph.walk_children),
+            "sinks": int(graph.sink.sum()),
+            "duplicates": len(graph.duplicate_names),
+        },
+        "degrees": {"out": _degree_summary(out_degree), "in": _degree_summary(in_degree)},
+        "components": {
+            "count": int(count),
+            "nontrivial": int((sizes > 1).sum()),
+            "largest": int(sizes.max()) if count else 0,
+            "largest_fraction": float(sizes.max() / n) if count else 0.0,
+            "closed": int(closed.sum()),
+            "sizes": [int(s) for s in sizes[by_size][:top]],
+            "size_histogram": [
+                [int(s), int(c)] for s, c in sorted(Counter(sizes.tolist()).items())
+            ],
+        },
+        "stationary": {
+            "weighted": bool(weighted),
+            "start": start,
+            "iterations": iterations,
+            "converged": converged,
+            "entropy_bits": entropy,
+            # how many equally likely progressions would give the same entropy
+            "effective_nodes": 2.0**entropy,
+            "support": int((distribution > 1e-9).sum()),
+            "top": [
+                {"name": graph.names[i], "probability": float(distribution[i])}
+                for i in np.argsort(-distribution, kind="stable")[:top].tolist()
+            ],
+            "datasets": {
+                name: p for name, p in sorted(datasets.items(), key=lambda kv: -kv[1])
+            },
+        },
+    }
+
+    if start_id is not None:
+        reachable = reachable_from(graph, start_id)
+        returns = graph.walk_distances_to(start_id) >= 0
+        report["start"] = {
+            "name": graph.names[start_id],
+            "component": int(labels[start_id]),
+            "component_size": int(sizes[labels[start_id]]),
+            "component_closed": bool(closed[labels[start_id]]),
+            "reachable": int(reachable.sum()),
+            "unreachable": int(n - reachable.sum()),
+            "can_return": int((reachable & returns).sum()),
+        }
+    return report
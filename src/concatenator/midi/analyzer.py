@@ -1,22 +1,131 @@
 """MIDI analysis functions for chord extraction and interval calculation."""
 
 import os
-import pickle
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
-import numpy as np
-from music21 import converter
+from .smf import progression_summary
+
+
+# How boundary chords are extracted: the raw-MIDI reader (falling back to
+# music21 for files it can't read), music21's chordify, or both with a check
+ANALYSIS_BACKENDS = ("fast", "music21", "verify")
+
+# Bump whenever the layout of the analysis store (or of the per-file nodes) changes
+ANALYSIS_CACHE_VERSION = 5
+
+# Rough heap cost of one music21 object in a parsed stream (measured with
+# tracemalloc on the bundled corpus: ~4.5-6 KiB per element)
+_BYTES_PER_STREAM_ELEMENT = 5 * 1024
+
+
+def _parse_midi(name):
+    """Parse a MIDI file into a music21 stream (uncached)."""
+    from music21 import converter
+
+    return converter.parse(name)
+
+
+def _estimate_stream_bytes(parsed):
+    """Approximate the memory held by a parsed stream from its element count."""
+    return sum(1 for _ in parsed.recurse(includeSelf=True)) * _BYTES_PER_STREAM_ELEMENT
+
+
+class ParsedStreamCache:
+    """LRU cache of parsed music21 streams with an entry and a byte budget.
+
+    Sizes are estimates (see ``_estimate_stream_bytes``). The most recently
+    used stream is always kept, even if it alone exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._streams = OrderedDict()  # name -> (stream, estimated bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._streams)
+
+    def __contains__(self, name):
+        return name in self._streams
+
+    def get(self, name):
+        """Return the stream for ``name``, parsing it on a miss."""
+        if name in self._streams:
+            self.hits += 1
+            self._streams.move_to_end(name)
+            return self._streams[name][0]
+
+        self.misses += 1
+        parsed = _parse_midi(name)
+        size = _estimate_stream_bytes(parsed)
+        self._streams[name] = (parsed, size)
+        self.bytes += size
+        self._evict()
+        return parsed
+
+    def configure(self, max_entries=None, max_bytes=None):
+        """Change the budgets (None leaves a budget as is) and evict to fit."""
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        """Drop every cached stream (counters are kept)."""
+        self._streams.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """Return a dict of cache size and hit/miss/eviction counters."""
+        return {
+            "entries": len(self._streams),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _evict(self):
+        while len(self._streams) > 1 and (
+            len(self._streams) > self.max_entries or self.bytes > self.max_bytes
+        ):
+            _, (_, size) = self._streams.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
 
 
 # Cache parsed MIDI streams so we don't keep re-reading from disk
-_parsed_cache = {}
+_parsed_cache = ParsedStreamCache()
 
 
 def get_parsed(name):
     """Return a cached music21 stream for the given MIDI filename."""
-    if name not in _parsed_cache:
-        _parsed_cache[name] = converter.parse(name)
-    return _parsed_cache[name]
+    return _parsed_cache.get(name)
+
+
+def configure_parsed_cache(max_entries=None, max_bytes=None):
+    """Set the entry and/or byte budget of the shared parsed-stream cache."""
+    _parsed_cache.configure(max_entries=max_entries, max_bytes=max_bytes)
+
+
+def clear_parsed_cache():
+    """Release every stream held by the shared parsed-stream cache."""
+    _parsed_cache.clear()
+
+
+def parsed_cache_stats():
+    """Return size and hit/miss/eviction counters of the shared cache."""
+    return _parsed_cache.stats()
 
 
 def build_intervals(chord):
@@ -30,7 +139,12 @@ def build_intervals(chord):
       4-note windows, used to match 4–6 voice chords flexibly (top/middle/bottom).
     """
     # chord.pitches elements are already Pitch objects, so just use .midi
-    midi = sorted({p.midi for p in chord.pitches})
+    return build_intervals_from_midi({p.midi for p in chord.pitches})
+
+
+def build_intervals_from_midi(pitches):
+    """Same as :func:`build_intervals`, starting from a collection of MIDI numbers."""
+    midi = sorted(set(pitches))
 
     if not midi:
         return {
@@ -43,6 +157,12 @@ def build_intervals(chord):
             "match_patterns": [],
         }
 
+    return chord_fields(midi, tuple(int(hi - lo) for lo, hi in zip(midi, midi[1:])))
+
+
+def chord_fields(midi, intervals):
+    """Build the chord dict for ``midi``, a sorted, non-empty list of distinct
+    MIDI numbers, whose adjacent ``intervals`` are already known."""
     bass = midi[0]
     # if we have fewer than 3 notes, fall back sensibly
     if len(midi) > 2:
@@ -53,17 +173,9 @@ def build_intervals(chord):
         alto = midi[-1]
     soprano = midi[-1]
 
-    intervals = tuple(int(x) for x in np.diff(midi)) if len(midi) > 1 else ()
-
-    # build 4-note window patterns for flexible matching of 5–6 voice chords
-    match_patterns = []
-    if len(midi) >= 4:
-        for i in range(len(midi) - 3):
-            window = midi[i : i + 4]
-            diffs = np.diff(window)
-            # pattern for this window: the upper two adjacent intervals (T–A, A–S)
-            if len(diffs) >= 3:
-                match_patterns.append((int(diffs[1]), int(diffs[2])))
+    # build 4-note window patterns for flexible matching of 5–6 voice chords:
+    # each window's upper two adjacent intervals (T–A, A–S)
+    match_patterns = [intervals[i + 1 : i + 3] for i in range(len(midi) - 3)]
 
     return {
         "midi": midi,
@@ -85,77 +197,244 @@ def get_filelist(root: Path = Path(".")):
     return sorted(midi_files)
 
 
-def load_or_build_analysis(filelist, analysis_path="analysis.pkl"):
-    """Load cached analysis if possible; otherwise compute and cache it.
+def resolve_start(filelist, start):
+    """Resolve a starting file given as a (partial) path to one of ``filelist``.
 
-    We store both the analysis dict and a simple metadata dict of
-    {filename: mtime} so we can detect when files have changed.
+    Absolute paths are returned unchanged. Otherwise ``start`` must be a
+    substring of exactly one file, or the suffix of one of several.
+
+    Raises:
+        ValueError: If no file matches, or several do and none ends with ``start``
     """
-    stored_meta = None
-    arr_dict = {}
+    if Path(start).is_absolute():
+        return start
+    candidates = [f for f in filelist if start in f]
+    if len(candidates) == 1:
+        return candidates[0]
+    # prefer an exact match
+    exact = [f for f in candidates if f.endswith(start)]
+    if exact:
+        return exact[0]
+    if candidates:
+        listing = "".join(f"\n  {c}" for c in candidates[:10])
+        raise ValueError(
+            f"Multiple matches for '{start}':{listing}\nPlease specify a more precise path."
+        )
+    raise ValueError(f"Start file '{start}' not found in datasets.")
+
+
+def _music21_boundary_chords(data):
+    """Return (first_midi, last_midi) from music21's chordify, or None if empty."""
+    from music21 import converter
+
+    # convert the file's bytes to a music21 stream; analysis sees each file
+    # once, so don't push it through the shared parse cache
+    mid = converter.parseData(data, format="midi")
+    chords = mid.chordify()
+    # RECURSE to find chords anywhere in the structure
+    chord_elems = chords.recurse().getElementsByClass("Chord")
+
+    if len(chord_elems) == 0:
+        return None
+    return (
+        sorted({p.midi for p in chord_elems[0].pitches}),
+        sorted({p.midi for p in chord_elems[-1].pitches}),
+    )
+
+
+def _fast_boundary_chords(name, data, backend):
+    """Return (boundaries, fingerprint) from the raw-MIDI reader.
+
+    ``boundaries`` is (first_midi, last_midi), or None if the file is
+    empty; both come from one parse of ``data``. Falls back to music21 for
+    files the reader can't handle (with no fingerprint); in "verify" mode
+    both are run and music21's answer wins if they disagree.
+    """
+    try:
+        (first, last), fingerprint = progression_summary(data)
+    except Exception as e:
+        print(f"Warning: fast MIDI reader failed on {name} ({e}); using music21.")
+        return _music21_boundary_chords(data), None
+
+    result = (first, last) if first else None
+    if backend == "verify":
+        expected = _music21_boundary_chords(data)
+        if result != expected:
+            print(f"Warning: boundary chords for {name} differ from music21 "
+                  f"({result} != {expected}); using music21.")
+            return expected, fingerprint
+    return result, fingerprint
+
+
+def _fingerprint(data):
+    """Transposition-normalized content fingerprint (None if unreadable)."""
+    try:
+        return progression_summary(data)[1]
+    except Exception:
+        return None
+
+
+def analyze_file(name, backend="fast"):
+    """Analyze a single MIDI file's boundary chords.
+
+    Args:
+        name: MIDI filename
+        backend: One of ANALYSIS_BACKENDS
+
+    Returns:
+        A ``(node, message)`` tuple. ``node`` is the per-progression dict
+        stored in ``arr_dict`` (or None if the file was skipped), and
+        ``message`` explains why it was skipped (or None).
+    """
+    try:
+        # read once: the chord extraction and the fingerprint share the bytes
+        with open(name, "rb") as fp:
+            data = fp.read()
+        if backend == "music21":
+            boundaries = _music21_boundary_chords(data)
+            fingerprint = _fingerprint(data)
+        else:
+            boundaries, fingerprint = _fast_boundary_chords(name, data, backend)
+
+        if boundaries is None:
+            return None, f"Skipping {name}: no chords found after chordify()"
+
+        # get intervals of first and last chords of each progression
+        first_chord = build_intervals_from_midi(boundaries[0])
+        last_chord = build_intervals_from_midi(boundaries[1])
+
+        # skip snippets that begin AND end with a stable 3-voice texture
+        if len(first_chord["midi"]) == 3 and len(last_chord["midi"]) == 3:
+            return None, f"Skipping {name}: 3-voice texture at both start and end."
+
+        current = {"children": [], "parents": []}
+        current["first_chord"] = first_chord
+        current["last_chord"] = last_chord
+
+        # how much we need to transpose the NEXT progression (cumulative later)
+        current["transposer"] = current["last_chord"]["bass"] - current["first_chord"]["bass"]
+        current["fingerprint"] = fingerprint
+        return current, None
+
+    except Exception as e:
+        # keep going if one file is weird
+        return None, f"Skipping {name}: error during analysis ({e})"
+
+
+def _resolve_workers(workers):
+    """Normalize a worker-count option: None/1 means serial, 0 means all cores."""
+    if workers is None:
+        return 1
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def analyze_files(filelist, workers=None, backend="fast"):
+    """Analyze every file in ``filelist``, optionally across a process pool.
+
+    Args:
+        filelist: MIDI filenames to analyze
+        workers: Number of worker processes (None or 1 = serial, 0 = one per CPU)
+        backend: Boundary-chord extractor, one of ANALYSIS_BACKENDS
+
+    Returns:
+        Dict of {filename: node} for the files that could be analyzed, in
+        the same order as ``filelist``.
+    """
+    workers = min(_resolve_workers(workers), max(1, len(filelist)))
+
+    if workers == 1:
+        results = (analyze_file(name, backend) for name in filelist)
+    else:
+        # chunk the work so each worker gets a handful of files per round trip
+        chunksize = max(1, len(filelist) // (workers * 8))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        worker = partial(analyze_file, backend=backend)
+        results = executor.map(worker, filelist, chunksize=chunksize)
 
-    if os.path.exists(analysis_path):
-        try:
-            with open(analysis_path, "rb") as fp:
-                loaded = pickle.load(fp)
-            # Backwards compatibility: older pickles may only contain arr_dict
-            if isinstance(loaded, tuple) and len(loaded) == 2:
-                stored_meta, arr_dict = loaded
-            else:
-                arr_dict = loaded
-        except Exception as e:
-            print(f"Warning: could not load cached analysis ({e}); rebuilding.")
-            stored_meta = None
-            arr_dict = {}
-
-    current_meta = {f: os.path.getmtime(f) for f in filelist}
-
-    # If we have analysis and the meta matches, reuse it
-    if arr_dict and stored_meta == current_meta:
-        return arr_dict
-
-    # Otherwise, rebuild analysis from scratch
     arr_dict = {}
-    for var in filelist:
-        try:
-            # convert to music21 stream
-            mid = get_parsed(var)
-            chords = mid.chordify()
-            # RECURSE to find chords anywhere in the structure
-            chord_elems = chords.recurse().getElementsByClass("Chord")
-
-            if len(chord_elems) == 0:
-                print(f"Skipping {var}: no chords found after chordify()")
-                continue
-
-            # get intervals of first and last chords of each progression
-            first_chord = build_intervals(chord_elems[0])
-            last_chord = build_intervals(chord_elems[-1])
-
-            # skip snippets that begin AND end with a stable 3-voice texture
-            if len(first_chord["midi"]) == 3 and len(last_chord["midi"]) == 3:
-                print(f"Skipping {var}: 3-voice texture at both start and end.")
-                continue
-
-            current = {"children": [], "parents": []}
-            current["first_chord"] = first_chord
-            current["last_chord"] = last_chord
-
-            # how much we need to transpose the NEXT progression (cumulative later)
-            current["transposer"] = (
-                current["last_chord"]["bass"] - current["first_chord"]["bass"]
-            )
-            arr_dict[var] = current
-
-        except Exception as e:
-            # keep going if one file is weird
-            print(f"Skipping {var}: error during analysis ({e})")
-            continue
+    try:
+        for name, (node, message) in zip(filelist, results):
+            if message:
+                print(message)
+            if node is not None:
+                arr_dict[name] = node
+    finally:
+        if workers > 1:
+            executor.shutdown()
+
+    return arr_dict
+
+
+def _file_signature(name):
+    """Cheap change detector for a file: (size, mtime in ns)."""
+    st = os.stat(name)
+    return st.st_size, st.st_mtime_ns
+
+
+def _load_analysis_cache(analysis_path, names):
+    """Read the cache entries for ``names`` from the store at ``analysis_path``.
+
+    Returns:
+        ``(entries, stored)``: the entries found, and how many files the
+        store holds in total (``({}, 0)`` if there is no usable store)
+    """
+    from .store import AnalysisStore
+
+    if not os.path.exists(analysis_path):
+        return {}, 0
+
+    try:
+        store = AnalysisStore(analysis_path)
+        return store.entries(names), len(store)
+    except Exception as e:
+        print(f"Warning: could not load cached analysis ({e}); rebuilding.")
+        return {}, 0
+
+
+def load_or_build_analysis(filelist, analysis_path="analysis.store", workers=None, backend="fast"):
+    """Load cached analysis where possible; analyze only new or changed files.
+
+    The cache holds one entry per file, keyed by filename and validated
+    against the file's size and mtime. Unchanged files (including ones that
+    were skipped last time) are reused as-is, new or modified files are
+    re-analyzed, and files that no longer exist are dropped from the cache.
+
+    ``workers`` and ``backend`` are passed through to :func:`analyze_files`
+    for the files that need analysis. Entries produced by a different
+    backend are treated as stale.
+
+    The cache is an :class:`~concatenator.midi.store.AnalysisStore` at
+    ``analysis_path``; only the entries for ``filelist`` are read from it.
+    """
+    from .store import write_analysis_store
+
+    cached, stored = _load_analysis_cache(analysis_path, filelist)
+
+    entries = {}
+    stale = []
+    for name in filelist:
+        signature = _file_signature(name)
+        entry = cached.get(name)
+        if entry is not None and (entry["signature"], entry["backend"]) == (signature, backend):
+            entries[name] = entry
+        else:
+            entries[name] = {"signature": signature, "backend": backend, "node": None}
+            stale.append(name)
+
+    if stale:
+        if cached:
+            print(f"Analyzing {len(stale)} new or changed file(s).")
+        for name, node in analyze_files(stale, workers=workers, backend=backend).items():
+            entries[name]["node"] = node
+
+    arr_dict = {name: entry["node"] for name, entry in entries.items() if entry["node"]}
 
     if not arr_dict:
         raise SystemExit("No usable MIDI files found (all failed analysis).")
 
-    with open(analysis_path, "wb") as fp:
-        pickle.dump((current_meta, arr_dict), fp)
+    if stale or len(entries) != stored:
+        write_analysis_store(analysis_path, entries)
 
     return arr_dict
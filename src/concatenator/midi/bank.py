@@ -0,0 +1,257 @@
+"""Precompiled, memory-mapped bank of progression snippets.
+
+Every walk step otherwise re-fetches a music21 stream, slices out its
+first measure, chordifies it and transposes the result. The snippet a
+progression contributes never changes, so :func:`compile_bank` does that
+work once and stores each snippet as a run of chord events (durations,
+MIDI pitches and per-pitch tie types) in a single bank file. The file is
+opened with ``np.memmap``, so several worker processes can share one copy
+of it through the OS page cache.
+
+Bank layout: an 8-byte magic, a little-endian uint64 header length, a
+JSON header (format version, progression names, source-file signatures and
+the dtype/shape/offset of each array), then the arrays, each aligned to 64
+bytes.
+"""
+
+import json
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .analyzer import _resolve_workers
+
+BANK_MAGIC = b"CCBANK\x00\x01"
+BANK_VERSION = 1
+
+# tie type <-> code stored per pitch in the bank
+TIE_TYPES = (None, "start", "stop", "continue")
+
+_ALIGN = 64
+
+
+def first_measure(prog_stream):
+    """Return the part of a progression a walk step uses.
+
+    Try to take the first notated measure (1-based in music21). If that
+    gives an empty slice, fall back to the whole stream.
+    """
+    c = prog_stream.measures(1, 1)
+    if len(c.recurse().notesAndRests) == 0:
+        c = prog_stream
+    return c
+
+
+def snippet_elements(c):
+    """Chordify a snippet, keeping only its chords, notes and rests."""
+    from music21 import chord, note
+
+    return [
+        el
+        for el in c.chordify().flatten()
+        if isinstance(el, (chord.Chord, note.Note, note.Rest))
+    ]
+
+
+def element_events(elements):
+    """Turn chordified snippet elements into [(duration, pitches, ties)].
+
+    ``pitches`` lists MIDI numbers (empty for a rest) and ``ties`` the
+    matching tie codes (indices into TIE_TYPES).
+    """
+    events = []
+    for el in elements:
+        notes = el.notes if el.isChord else ([el] if el.isNote else [])
+        events.append(
+            (
+                float(el.quarterLength),
+                [n.pitch.midi for n in notes],
+                [TIE_TYPES.index(n.tie.type) if n.tie else 0 for n in notes],
+            )
+        )
+    return events
+
+
+def _snippet_events(name):
+    """Compile one progression's snippet into [(duration, pitches, ties)]."""
+    from music21 import converter
+
+    return element_events(snippet_elements(first_measure(converter.parse(name))))
+
+
+def _file_signature(name):
+    st = os.stat(name)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def compile_bank(names, bank_path, workers=None):
+    """Compile the snippets of ``names`` into a bank file at ``bank_path``.
+
+    Args:
+        names: Progression filenames, in node-id order
+        bank_path: Output path
+        workers: Worker processes for compilation (None or 1 = serial,
+            0 = one per CPU core)
+
+    Returns:
+        The opened ProgressionBank
+    """
+    names = list(names)
+    workers = min(_resolve_workers(workers), max(1, len(names)))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            snippets = list(executor.map(_snippet_events, names, chunksize=8))
+    else:
+        snippets = [_snippet_events(name) for name in names]
+
+    event_counts = [len(events) for events in snippets]
+    pitch_counts = [len(pitches) for events in snippets for _, pitches, _ in events]
+    arrays = {
+        "event_ptr": np.concatenate([[0], np.cumsum(event_counts)]).astype(np.int64),
+        "durations": np.array(
+            [d for events in snippets for d, _, _ in events], dtype=np.float64
+        ),
+        "pitch_ptr": np.concatenate([[0], np.cumsum(pitch_counts)]).astype(np.int64),
+        "pitches": np.array(
+            [p for events in snippets for _, pitches, _ in events for p in pitches],
+            dtype=np.int16,
+        ),
+        "ties": np.array(
+            [t for events in snippets for _, _, ties in events for t in ties], dtype=np.int8
+        ),
+    }
+
+    header = {
+        "version": BANK_VERSION,
+        "names": names,
+        "signatures": [_file_signature(name) for name in names],
+    }
+    _write_array_file(bank_path, BANK_MAGIC, header, arrays)
+    return ProgressionBank(bank_path)
+
+
+def _write_array_file(path, magic, header, arrays):
+    """Write ``arrays`` after ``magic`` and a JSON ``header``, 64-byte aligned.
+
+    The dtype, shape and offset of each array are added to the header under
+    ``"arrays"``. The file is written to a temporary path and moved into
+    place, so readers never see a half-written file.
+    """
+    specs = {}
+    offset = 0
+    for key, arr in arrays.items():
+        offset = -(-offset // _ALIGN) * _ALIGN
+        specs[key] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += arr.nbytes
+
+    header = json.dumps(dict(header, arrays=specs)).encode()
+    data_start = -(-(len(magic) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(magic)
+        fp.write(struct.pack("<Q", len(header)))
+        fp.write(header)
+        for key, arr in arrays.items():
+            fp.seek(data_start + specs[key]["offset"])
+            fp.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp_path, path)
+
+
+def _map_array_file(path, magic, kind):
+    """Read a file written by :func:`_write_array_file`.
+
+    Returns:
+        ``(header, arrays)``, with each array memory-mapped read-only
+        (empty arrays are plain ones, since a zero-length map is an error)
+
+    Raises:
+        ValueError: If the file doesn't start with ``magic``
+    """
+    with open(path, "rb") as fp:
+        if fp.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not {kind}")
+        (header_len,) = struct.unpack("<Q", fp.read(8))
+        header = json.loads(fp.read(header_len))
+
+    data_start = -(-(len(magic) + 8 + header_len) // _ALIGN) * _ALIGN
+    arrays = {}
+    for key, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        if not np.prod(shape):
+            arrays[key] = np.empty(shape, dtype=spec["dtype"])
+        else:
+            arrays[key] = np.memmap(
+                path,
+                dtype=spec["dtype"],
+                mode="r",
+                offset=data_start + spec["offset"],
+                shape=shape,
+            )
+    return header, arrays
+
+
+class ProgressionBank:
+    """Read-only, memory-mapped view of a compiled progression bank.
+
+    Snippet ``i`` (``names[i]``) spans events
+    ``event_ptr[i]:event_ptr[i + 1]``; event ``e`` lasts ``durations[e]``
+    quarter lengths and holds ``pitches[pitch_ptr[e]:pitch_ptr[e + 1]]``
+    (no pitches = rest), with matching tie codes in ``ties``.
+    """
+
+    def __init__(self, bank_path):
+        header, arrays = _map_array_file(bank_path, BANK_MAGIC, "a progression bank")
+        if header["version"] != BANK_VERSION:
+            raise ValueError(f"Unsupported bank version {header['version']}")
+
+        self.path = bank_path
+        self.names = header["names"]
+        self.signatures = header["signatures"]
+        self.index = {name: i for i, name in enumerate(self.names)}
+        for key, arr in arrays.items():
+            setattr(self, key, arr)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def is_current(self, names):
+        """True if the bank holds exactly ``names`` and none of the files changed."""
+        if list(names) != self.names:
+            return False
+        return all(_file_signature(n) == sig for n, sig in zip(self.names, self.signatures))
+
+    def snippet(self, name_or_id, shift=0):
+        """Return a snippet's events, transposed by ``shift`` semitones.
+
+        Returns:
+            List of (duration, pitches, ties) tuples; ``pitches`` is an int
+            array (empty for a rest) and ``ties`` the matching tie types.
+        """
+        i = self.index[name_or_id] if isinstance(name_or_id, str) else name_or_id
+        events = []
+        for e in range(int(self.event_ptr[i]), int(self.event_ptr[i + 1])):
+            lo, hi = int(self.pitch_ptr[e]), int(self.pitch_ptr[e + 1])
+            ties = [TIE_TYPES[t] for t in self.ties[lo:hi].tolist()]
+            events.append((float(self.durations[e]), self.pitches[lo:hi] + shift, ties))
+        return events
+
+
+def load_or_compile_bank(names, bank_path="progressions.bank", workers=None):
+    """Open the bank at ``bank_path``, recompiling it if it is missing or stale."""
+    if os.path.exists(bank_path):
+        try:
+            bank = ProgressionBank(bank_path)
+        except Exception as e:
+            print(f"Warning: could not open progression bank ({e}); recompiling.")
+        else:
+            if bank.is_current(names):
+                return bank
+
+    print(f"Compiling progression bank for {len(names)} progressions...")
+    return compile_bank(names, bank_path, workers=workers)
@@ -0,0 +1,231 @@
+"""Vectorized generation of many progression walks at once.
+
+:func:`batch_walks` runs the same stepping rules as
+:func:`concatenator.midi.walker.random_walk` (loop-closure bias and return
+steering) for thousands of walks in lock-step, using NumPy over the
+ProgressionGraph's CSR arrays. It only produces node-id paths and the
+per-step transposition data; nothing touches music21, so candidates can be
+generated cheaply and only the chosen ones rendered with
+``random_walk(..., path=...)``.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+# How many times a walk redraws a child that fails the steering constraint
+# before falling back to an exact scan of its children
+_STEER_REDRAWS = 8
+
+WalkBatch = namedtuple("WalkBatch", "paths lengths normalizers transposers shifts")
+WalkBatch.__doc__ = """Result of :func:`batch_walks`; all arrays are (n_walks, max_steps).
+
+paths holds node ids (-1 past each walk's length), lengths the number of
+steps per walk, normalizers and transposers the walker's two per-step
+offsets, and shifts the total semitone transposition applied to each
+step's snippet (normalizer + transposer + octave correction).
+"""
+
+
+def walk_bounds(target_progressions):
+    """Return the (min_steps, max_steps) window for a target walk length."""
+    min_steps = max(1, int(target_progressions * 0.75))
+    max_steps = max(min_steps + 1, int(target_progressions * 1.5))
+    return min_steps, max_steps
+
+
+def _edge_keys(graph):
+    """Sorted int64 keys ``parent * n + child`` for every walk edge."""
+    n = len(graph)
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(graph.walk_ptr))
+    return np.sort(rows * n + graph.walk_children)
+
+
+def _has_edge(edge_keys, n, parents, children):
+    """Vectorized test of whether each parents[i] -> children[i] is a walk edge."""
+    keys = parents.astype(np.int64) * n + children
+    pos = np.searchsorted(edge_keys, keys)
+    pos[pos == len(edge_keys)] = 0
+    return edge_keys[pos] == keys if len(edge_keys) else np.zeros(len(keys), dtype=bool)
+
+
+def _allowed(dist, rows, nodes, current, step, min_steps, max_steps):
+    """Steering constraint of random_walk, vectorized over walks.
+
+    ``dist[rows[i]]`` is the return-distance table for walk i's start.
+    """
+    remaining = dist[rows, nodes]
+    here = dist[rows, current]
+    ok = (remaining >= 0) & (step + 1 + remaining <= max_steps)
+    homing = (step >= min_steps) & (here > 0)
+    return ok & (~homing | (remaining < here))
+
+
+def _draw(graph, rng, current, weighted=False):
+    """Draw a next step for each walk (any node from a dead end).
+
+    Steps are uniform over the walk edges, or follow the walk weights
+    through the alias tables with ``weighted``.
+    """
+    lo = graph.walk_ptr[current]
+    degree = graph.walk_ptr[current + 1] - lo
+    picks = (rng.random(len(current)) * degree).astype(np.int64)
+    live = degree > 0
+    if weighted:
+        # dead ends have no alias table entry to look up
+        edge = lo[live] + picks[live]
+        alias = rng.random(len(current))[live] >= graph.alias_prob[edge]
+        picks[np.flatnonzero(live)[alias]] = graph.alias_index[edge[alias]]
+
+    nxt = np.empty(len(current), dtype=np.int64)
+    nxt[live] = graph.walk_children[lo[live] + picks[live]]
+    nxt[~live] = rng.integers(len(graph), size=int((~live).sum()))
+    return nxt
+
+
+def _steered_draw(graph, rng, current, dist, rows, step, min_steps, max_steps, weighted=False):
+    """Draw among the children that satisfy the steering constraint."""
+    bounds = (step, min_steps, max_steps)
+    nxt = _draw(graph, rng, current, weighted)
+    pending = ~_allowed(dist, rows, nxt, current, *bounds)
+    for _ in range(_STEER_REDRAWS):
+        if not pending.any():
+            return nxt
+        idx = np.flatnonzero(pending)
+        nxt[idx] = _draw(graph, rng, current[idx], weighted)
+        pending[idx] = ~_allowed(dist, rows[idx], nxt[idx], current[idx], *bounds)
+
+    # few walks get here: filter their candidates exactly, as random_walk does
+    for i in np.flatnonzero(pending):
+        node = current[i]
+        if graph.walk_degree(node):
+            candidates = graph.walk_children_of(node)
+            weights = graph.walk_weights_of(node) if weighted else None
+        else:
+            candidates = np.arange(len(graph))
+            weights = None
+        ok = _allowed(
+            dist,
+            np.full(len(candidates), rows[i]),
+            candidates,
+            np.full(len(candidates), node),
+            *bounds,
+        )
+        if ok.any():
+            candidates = candidates[ok]
+            if weights is not None:
+                weights = weights[ok]
+        if weights is not None and weights.sum() > 0:
+            nxt[i] = rng.choice(candidates, p=weights / weights.sum())
+        else:
+            nxt[i] = candidates[rng.integers(len(candidates))]
+    return nxt
+
+
+def walk_transpositions(graph, paths, lengths):
+    """Per-step normalizer, transposer and total shift for walk paths.
+
+    Reproduces the offsets random_walk applies: the first snippet is centered
+    on middle C, later ones put their bass on MIDI 48, ``transposer``
+    accumulates each progression's bass movement, and an octave correction
+    keeps the soprano continuous across every join.
+
+    Returns:
+        ``(normalizers, transposers, shifts)`` int arrays shaped like ``paths``
+        (zero past each walk's length).
+    """
+    n_steps = paths.shape[1]
+    valid = np.arange(n_steps)[None, :] < lengths[:, None]
+    nodes = np.where(valid, paths, 0)
+
+    bass = graph.first_bass[nodes].astype(np.int64)
+    first_soprano = graph.first_soprano[nodes].astype(np.int64)
+    last_soprano = graph.last_soprano[nodes].astype(np.int64)
+    step_transposer = np.where(valid, graph.transposer[nodes], 0).astype(np.int64)
+
+    normalizers = 48 - bass
+    normalizers[:, 0] = np.round(60 - (bass[:, 0] + first_soprano[:, 0]) / 2.0)
+
+    transposers = np.zeros_like(normalizers)
+    transposers[:, 1:] = np.cumsum(step_transposer, axis=1)[:, :-1]
+
+    begin = first_soprano + transposers + normalizers
+    end = last_soprano + transposers + normalizers
+    octave = np.zeros_like(normalizers)
+    octave[:, 1:] = np.cumsum(end[:, :-1] - begin[:, 1:], axis=1)
+
+    shifts = normalizers + transposers + octave
+    return (
+        np.where(valid, normalizers, 0),
+        np.where(valid, transposers, 0),
+        np.where(valid, shifts, 0),
+    )
+
+
+def batch_walks(graph, starts, target_progressions=100, seed=None, steer=True, weighted=False):
+    """Generate many walk paths at once, following random_walk's rules.
+
+    Args:
+        graph: ProgressionGraph
+        starts: Start node ids or names, one per walk
+        target_progressions: Target number of progressions per walk (approximate)
+        seed: Seed (or np.random.Generator) for the transitions
+        steer: Steer each walk back to its start, as in random_walk
+        weighted: Follow the graph's walk weights instead of drawing uniformly
+
+    Returns:
+        A WalkBatch
+    """
+    starts = np.array(
+        [graph.node_id(s) if isinstance(s, str) else int(s) for s in starts], dtype=np.int64
+    )
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    min_steps, max_steps = walk_bounds(target_progressions)
+    n_walks = len(starts)
+
+    edge_keys = _edge_keys(graph)
+    if steer:
+        unique_starts, start_rows = np.unique(starts, return_inverse=True)
+        dist = np.stack([graph.walk_distances_to(s) for s in unique_starts])
+
+    paths = np.full((n_walks, max_steps), -1, dtype=np.int32)
+    lengths = np.zeros(n_walks, dtype=np.int32)
+    current = starts.copy()
+    active = np.arange(n_walks)
+
+    for step in range(1, max_steps + 1):
+        paths[active, step - 1] = current[active]
+        lengths[active] = step
+
+        # back at the start after the minimum length: this walk is done
+        if step > 1 and step >= min_steps:
+            active = active[current[active] != starts[active]]
+        if step == max_steps or not len(active):
+            break
+
+        node = current[active]
+        home = starts[active]
+        dead = graph.walk_ptr[node + 1] == graph.walk_ptr[node]
+        close = (step >= min_steps) & (dead | _has_edge(edge_keys, len(graph), node, home))
+
+        nxt = home.copy()
+        wander = ~close
+        if wander.any():
+            if steer:
+                nxt[wander] = _steered_draw(
+                    graph,
+                    rng,
+                    node[wander],
+                    dist,
+                    start_rows[active[wander]],
+                    step,
+                    min_steps,
+                    max_steps,
+                    weighted,
+                )
+            else:
+                nxt[wander] = _draw(graph, rng, node[wander], weighted)
+        current[active] = nxt
+
+    normalizers, transposers, shifts = walk_transpositions(graph, paths, lengths)
+    return WalkBatch(paths, lengths, normalizers, transposers, shifts)
@@ -0,0 +1,604 @@
+"""Compact, array-backed progression graph for walking.
+
+After analysis and pruning, the graph lives in ``arr_dict`` as a dict of
+dicts keyed by file path, with Python lists of paths for ``children``,
+``parents`` and ``non_sink_children``. :class:`ProgressionGraph` assigns
+each progression an integer id and stores the edges in CSR form (an
+``*_ptr`` offsets array plus a flat neighbor array), together with the
+per-node numbers the walker needs.
+
+Walk edges also carry a weight, by default favoring smooth voice leading
+across the join, and every node gets a Walker/Vose alias table over its
+walk edges so a weighted next step is drawn in O(1).
+"""
+
+import hashlib
+import os
+from collections import deque
+from types import SimpleNamespace
+
+import numpy as np
+
+from .graph import (
+    MATCH_RULES_VERSION,
+    build_connections,
+    build_non_sink_children,
+    prune_sinks,
+)
+
+# Bump when the arrays stored by ProgressionGraph.save change
+GRAPH_FORMAT_VERSION = 5
+
+# Edges per chunk in voice_leading_distance, bounding its (edges x voices)
+# temporaries on graphs with hundreds of thousands of edges
+_VOICE_LEADING_CHUNK = 1 << 16
+
+# Array attributes written by ProgressionGraph.save, in constructor order
+_ARRAY_FIELDS = (
+    "children_ptr",
+    "children",
+    "parents_ptr",
+    "parents",
+    "walk_ptr",
+    "walk_children",
+    "sink",
+    "first_bass",
+    "first_soprano",
+    "last_soprano",
+    "transposer",
+    "first_voicing",
+    "last_voicing",
+    "first_voices",
+    "last_voices",
+    "walk_weights",
+    "alias_prob",
+    "alias_index",
+    "children_cost",
+    "children_deviation",
+    "duplicate_ptr",
+    "duplicate_names",
+    "duplicate_offsets",
+)
+
+
+def _csr(rows, index):
+    """Pack a list of name lists into (ptr, flat) CSR arrays of node ids."""
+    ptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum([len(row) for row in rows])
+    flat = np.fromiter(
+        (index[name] for row in rows for name in row), dtype=np.int32, count=int(ptr[-1])
+    )
+    return ptr, flat
+
+
+def _voicings(chords):
+    """Pack chords' MIDI pitches top-down into an (n, max voices) matrix.
+
+    Rows are padded with the chord's bass, so pairing two rows column by
+    column pairs voices from the top and gives the smaller chord's bass any
+    voices it lacks. Returns (voicing matrix, voice counts).
+    """
+    counts = np.array([len(c["midi"]) for c in chords], dtype=np.int8)
+    width = max(1, int(counts.max())) if len(chords) else 1
+    voicing = np.zeros((len(chords), width), dtype=np.int16)
+    for row, c in enumerate(chords):
+        pitches = sorted(c["midi"], reverse=True)
+        if pitches:
+            voicing[row] = pitches + [pitches[-1]] * (width - len(pitches))
+    return voicing, counts
+
+
+def _alias_table(weights):
+    """Walker/Vose alias table for one node's edge weights.
+
+    Returns (prob, alias): draw ``k`` uniformly, keep it with probability
+    ``prob[k]``, otherwise take ``alias[k]``.
+    """
+    n = len(weights)
+    prob = np.ones(n)
+    alias = np.arange(n, dtype=np.int32)
+    total = float(np.sum(weights))
+    if n == 0 or total <= 0:
+        return prob, alias
+
+    scaled = np.asarray(weights, dtype=np.float64) * (n / total)
+    small = [k for k in range(n) if scaled[k] < 1.0]
+    large = [k for k in range(n) if scaled[k] >= 1.0]
+    while small and large:
+        small_k, large_k = small.pop(), large.pop()
+        prob[small_k] = scaled[small_k]
+        alias[small_k] = large_k
+        scaled[large_k] -= 1.0 - scaled[small_k]
+        (small if scaled[large_k] < 1.0 else large).append(large_k)
+    # leftovers are 1 up to rounding
+    for k in small + large:
+        prob[k] = 1.0
+    return prob, alias
+
+
+def _boundaries(nodes):
+    """Per-node boundary-chord arrays for a list of arr_dict nodes.
+
+    Returns the keyword arguments ProgressionGraph takes for them
+    (everything :func:`voice_leading_distance` reads).
+    """
+    first_voicing, first_voices = _voicings([node["first_chord"] for node in nodes])
+    last_voicing, last_voices = _voicings([node["last_chord"] for node in nodes])
+    return {
+        "first_soprano": np.array([n["first_chord"]["soprano"] for n in nodes], dtype=np.int16),
+        "last_soprano": np.array([n["last_chord"]["soprano"] for n in nodes], dtype=np.int16),
+        "first_voicing": first_voicing,
+        "last_voicing": last_voicing,
+        "first_voices": first_voices,
+        "last_voices": last_voices,
+    }
+
+
+def voice_leading_distance(graph, parents, children):
+    """Voice-leading distance across each parent -> child join, vectorized.
+
+    The walker transposes each snippet so its opening soprano continues the
+    previous snippet's closing soprano. With the child moved that way,
+    voices are paired from the top down (the chord with fewer voices repeats
+    its bass) and the distance is the total semitone motion. Pairs are
+    processed in fixed-size chunks of whole-array operations, so there is no
+    per-edge Python work and memory stays bounded however many edges there
+    are.
+
+    Args:
+        graph: ProgressionGraph (or anything with its boundary-chord arrays)
+        parents: Array of parent node ids
+        children: Array of child node ids, same length
+
+    Returns:
+        int32 array of distances, one per pair
+    """
+    parents = np.asarray(parents, dtype=np.int64)
+    children = np.asarray(children, dtype=np.int64)
+    costs = np.empty(len(parents), dtype=np.int32)
+    columns = np.arange(graph.last_voicing.shape[1])
+
+    for lo in range(0, len(parents), _VOICE_LEADING_CHUNK):
+        p = parents[lo : lo + _VOICE_LEADING_CHUNK]
+        c = children[lo : lo + _VOICE_LEADING_CHUNK]
+        shift = graph.last_soprano[p].astype(np.int32) - graph.first_soprano[c]
+        motion = np.abs(
+            graph.last_voicing[p].astype(np.int32)
+            - graph.first_voicing[c].astype(np.int32)
+            - shift[:, None]
+        )
+        voices = np.maximum(graph.last_voices[p], graph.first_voices[c])
+        motion[columns[None, :] >= voices[:, None]] = 0
+        costs[lo : lo + len(p)] = motion.sum(axis=1)
+    return costs
+
+
+def drop_rough_connections(arr_dict, max_voice_leading):
+    """Remove connections whose voice-leading distance exceeds a threshold.
+
+    Runs on a connected (not yet pruned) arr_dict, scoring every matched
+    pair in one :func:`voice_leading_distance` call; ``children`` and
+    ``parents`` keep their arr_dict order.
+
+    Returns:
+        Number of connections removed
+    """
+    names = list(arr_dict)
+    index = {name: i for i, name in enumerate(names)}
+    nodes = list(arr_dict.values())
+
+    ptr, children = _csr([node["children"] for node in nodes], index)
+    parents = np.repeat(np.arange(len(nodes)), np.diff(ptr))
+    costs = voice_leading_distance(SimpleNamespace(**_boundaries(nodes)), parents, children)
+    keep = costs <= max_voice_leading
+
+    for node in nodes:
+        node["parents"] = []
+    for i, (name, node) in enumerate(zip(names, nodes)):
+        row = slice(ptr[i], ptr[i + 1])
+        node["children"] = [names[child] for child in children[row][keep[row]].tolist()]
+        for child in node["children"]:
+            arr_dict[child]["parents"].append(name)
+        if "child_deviations" in node:
+            deviations = np.asarray(node["child_deviations"], dtype=np.int8)
+            node["child_deviations"] = deviations[keep[row]].tolist()
+    return int(len(keep) - keep.sum())
+
+
+def default_walk_weights(graph):
+    """Weight each walk edge by 1 / (1 + voice-leading distance)."""
+    rows = np.repeat(np.arange(len(graph)), np.diff(graph.walk_ptr))
+    return 1.0 / (1.0 + voice_leading_distance(graph, rows, graph.walk_children))
+
+
+def dataset_walk_weights(graph, factors, weights=None):
+    """Scale walk weights by the dataset each edge leads into.
+
+    A progression's dataset is the directory holding its file (e.g.
+    ``reger`` for ``datasets/reger/1.mid``).
+
+    Args:
+        graph: ProgressionGraph
+        factors: Dict of {dataset name: weight multiplier}; others keep 1.0
+        weights: Weights to scale (default: the graph's current walk weights)
+
+    Returns:
+        New weights parallel to ``graph.walk_children``
+    """
+    if weights is None:
+        weights = graph.walk_weights
+    node_factor = np.array(
+        [factors.get(os.path.basename(os.path.dirname(name)), 1.0) for name in graph.names]
+    )
+    return np.asarray(weights, dtype=np.float64) * node_factor[graph.walk_children]
+
+
+def parse_dataset_weights(items):
+    """Parse ``NAME=FACTOR`` strings into dataset_walk_weights factors.
+
+    Args:
+        items: Iterable of strings such as ``"reger=2"``
+
+    Returns:
+        Dict of {dataset name: factor}; a repeated name keeps its last factor
+
+    Raises:
+        ValueError: If an item isn't ``NAME=FACTOR`` with a non-empty name and a
+            finite factor of 0 or more
+    """
+    factors = {}
+    for item in items:
+        dataset, _, factor = item.partition("=")
+        try:
+            value = float(factor)
+        except ValueError:
+            value = None
+        if not dataset or value is None or not (np.isfinite(value) and value >= 0):
+            raise ValueError(f"Invalid dataset weight '{item}' (expected NAME=FACTOR).")
+        factors[dataset] = value
+    return factors
+
+
+class ProgressionGraph:
+    """Progression graph with integer node ids and CSR edge arrays.
+
+    Node ``i`` is ``names[i]``. Its neighbors are
+    ``children[children_ptr[i]:children_ptr[i + 1]]`` (likewise for
+    ``parents`` and ``walk_children``, the non-sink children the walker
+    draws from). Per-node arrays hold the first chord's bass and soprano,
+    the last chord's soprano, the cumulative ``transposer`` step, and the
+    sink flag; ``first_voicing`` / ``last_voicing`` hold the boundary chords
+    top-down (see :func:`_voicings`). ``walk_weights`` runs parallel to
+    ``walk_children``, with each node's alias table in ``alias_prob`` and
+    ``alias_index`` (indices local to the node's row); ``children_cost``
+    and ``children_deviation`` run parallel to ``children`` with each
+    connection's voice-leading distance (see :func:`voice_leading_distance`)
+    and the interval tolerance it was matched with (0 = exact). Nodes
+    collapsed by :func:`~concatenator.midi.graph.collapse_duplicates` list
+    their duplicates in ``duplicate_names[duplicate_ptr[i]:duplicate_ptr[i + 1]]``,
+    each ``duplicate_offsets`` semitones above node ``i``.
+    """
+
+    def __init__(
+        self,
+        names,
+        children_ptr,
+        children,
+        parents_ptr,
+        parents,
+        walk_ptr,
+        walk_children,
+        sink,
+        first_bass,
+        first_soprano,
+        last_soprano,
+        transposer,
+        first_voicing,
+        last_voicing,
+        first_voices,
+        last_voices,
+        walk_weights=None,
+        alias_prob=None,
+        alias_index=None,
+        children_cost=None,
+        children_deviation=None,
+        duplicate_ptr=None,
+        duplicate_names=None,
+        duplicate_offsets=None,
+    ):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if duplicate_ptr is None:
+            duplicate_ptr = np.zeros(len(self.names) + 1, dtype=np.int64)
+            duplicate_names = np.array([], dtype=str)
+            duplicate_offsets = np.array([], dtype=np.int16)
+        self.duplicate_ptr = duplicate_ptr
+        self.duplicate_names = duplicate_names
+        self.duplicate_offsets = duplicate_offsets
+        # duplicate name -> id of the node it was collapsed into
+        self.duplicate_of = {
+            str(name): int(node_id)
+            for node_id, name in zip(
+                np.repeat(np.arange(len(self.names)), np.diff(duplicate_ptr)), duplicate_names
+            )
+        }
+        self.children_ptr = children_ptr
+        self.children = children
+        self.parents_ptr = parents_ptr
+        self.parents = parents
+        self.walk_ptr = walk_ptr
+        self.walk_children = walk_children
+        self.sink = sink
+        self.first_bass = first_bass
+        self.first_soprano = first_soprano
+        self.last_soprano = last_soprano
+        self.transposer = transposer
+        self.first_voicing = first_voicing
+        self.last_voicing = last_voicing
+        self.first_voices = first_voices
+        self.last_voices = last_voices
+        if children_cost is None:
+            rows = np.repeat(np.arange(len(self.names)), np.diff(children_ptr))
+            children_cost = voice_leading_distance(self, rows, children)
+        self.children_cost = children_cost
+        if children_deviation is None:
+            children_deviation = np.zeros(len(children), dtype=np.int8)
+        self.children_deviation = children_deviation
+        if walk_weights is None:
+            self.set_walk_weights(default_walk_weights(self))
+        else:
+            self.walk_weights = walk_weights
+            self.alias_prob = alias_prob
+            self.alias_index = alias_index
+
+    @classmethod
+    def from_arr_dict(cls, arr_dict):
+        """Build a compact graph from an analyzed, connected and pruned arr_dict.
+
+        ``arr_dict`` must already have gone through ``build_connections``,
+        ``prune_sinks`` and ``build_non_sink_children``.
+        """
+        names = list(arr_dict)
+        index = {name: i for i, name in enumerate(names)}
+        nodes = list(arr_dict.values())
+
+        children_ptr, children = _csr([node["children"] for node in nodes], index)
+        parents_ptr, parents = _csr([node["parents"] for node in nodes], index)
+        walk_ptr, walk_children = _csr([node["non_sink_children"] for node in nodes], index)
+
+        def per_node(get, dtype=np.int16):
+            return np.fromiter((get(node) for node in nodes), dtype=dtype, count=len(nodes))
+
+        duplicate_ptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        duplicate_ptr[1:] = np.cumsum([len(node.get("aliases") or ()) for node in nodes])
+        aliases = [alias for node in nodes for alias in node.get("aliases") or ()]
+
+        return cls(
+            names,
+            children_ptr,
+            children,
+            parents_ptr,
+            parents,
+            walk_ptr,
+            walk_children,
+            sink=per_node(lambda node: bool(node.get("sink")), dtype=bool),
+            first_bass=per_node(lambda node: node["first_chord"]["bass"]),
+            transposer=per_node(lambda node: node["transposer"]),
+            children_deviation=np.fromiter(
+                (
+                    deviation
+                    for node in nodes
+                    for deviation in node.get("child_deviations") or [0] * len(node["children"])
+                ),
+                dtype=np.int8,
+                count=len(children),
+            ),
+            duplicate_ptr=duplicate_ptr,
+            duplicate_names=np.array([name for name, _ in aliases], dtype=str),
+            duplicate_offsets=np.array([offset for _, offset in aliases], dtype=np.int16),
+            **_boundaries(nodes),
+        )
+
+    def save(self, path, fingerprint):
+        """Write the graph to an .npz file tagged with ``fingerprint``."""
+        arrays = {field: getattr(self, field) for field in _ARRAY_FIELDS}
+        with open(path, "wb") as fp:
+            np.savez(
+                fp,
+                fingerprint=np.array(fingerprint),
+                names=np.array(self.names, dtype=str),
+                **arrays,
+            )
+
+    @classmethod
+    def load(cls, path, fingerprint=None):
+        """Read a graph written by :meth:`save`.
+
+        Returns None if ``fingerprint`` is given and doesn't match the one
+        stored in the file.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if fingerprint is not None and str(data["fingerprint"]) != fingerprint:
+                return None
+            return cls(data["names"].tolist(), *(data[field] for field in _ARRAY_FIELDS))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index or name in self.duplicate_of
+
+    def node_id(self, name):
+        """Id of the node for ``name``, which may also be a collapsed duplicate."""
+        if name in self.index:
+            return self.index[name]
+        return self.duplicate_of[name]
+
+    def aliases_of(self, node_id):
+        """Return ``[(name, offset)]`` for the duplicates collapsed into ``node_id``."""
+        lo, hi = self.duplicate_ptr[node_id], self.duplicate_ptr[node_id + 1]
+        return [
+            (str(name), int(offset))
+            for name, offset in zip(self.duplicate_names[lo:hi], self.duplicate_offsets[lo:hi])
+        ]
+
+    def rendered_names(self):
+        """Every file a walk may render: node names, then all their duplicates."""
+        return self.names + [str(name) for name in self.duplicate_names]
+
+    def children_of(self, node_id):
+        """Return the ids of all children of ``node_id`` (an array view)."""
+        return self.children[self.children_ptr[node_id] : self.children_ptr[node_id + 1]]
+
+    def parents_of(self, node_id):
+        """Return the ids of all parents of ``node_id`` (an array view)."""
+        return self.parents[self.parents_ptr[node_id] : self.parents_ptr[node_id + 1]]
+
+    def children_costs_of(self, node_id):
+        """Return the voice-leading distances to the children of ``node_id`` (an array view)."""
+        return self.children_cost[self.children_ptr[node_id] : self.children_ptr[node_id + 1]]
+
+    def children_deviations_of(self, node_id):
+        """Return the match tolerance used for each child of ``node_id`` (an array view)."""
+        return self.children_deviation[
+            self.children_ptr[node_id] : self.children_ptr[node_id + 1]
+        ]
+
+    def walk_children_of(self, node_id):
+        """Return the ids of the non-sink children of ``node_id`` (an array view)."""
+        return self.walk_children[self.walk_ptr[node_id] : self.walk_ptr[node_id + 1]]
+
+    def walk_degree(self, node_id):
+        """Number of non-sink children of ``node_id``."""
+        return int(self.walk_ptr[node_id + 1] - self.walk_ptr[node_id])
+
+    def walk_child(self, node_id, k):
+        """The ``k``-th non-sink child of ``node_id``, as a plain int."""
+        return int(self.walk_children[self.walk_ptr[node_id] + k])
+
+    def walk_weights_of(self, node_id):
+        """Return the weights of the walk edges out of ``node_id`` (an array view)."""
+        return self.walk_weights[self.walk_ptr[node_id] : self.walk_ptr[node_id + 1]]
+
+    def set_walk_weights(self, weights):
+        """Replace the walk-edge weights and rebuild every node's alias table.
+
+        Args:
+            weights: Non-negative weights parallel to ``walk_children``
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.shape != self.walk_children.shape:
+            raise ValueError("Need one weight per walk edge.")
+        if (weights < 0).any():
+            raise ValueError("Walk weights must be non-negative.")
+
+        self.walk_weights = weights
+        self.alias_prob = np.ones(len(weights))
+        self.alias_index = np.zeros(len(weights), dtype=np.int32)
+        for node_id in range(len(self)):
+            lo, hi = self.walk_ptr[node_id], self.walk_ptr[node_id + 1]
+            self.alias_prob[lo:hi], self.alias_index[lo:hi] = _alias_table(weights[lo:hi])
+
+    def sample_walk_child(self, node_id, rng):
+        """Draw a walk edge of ``node_id`` in proportion to its weight, in O(1).
+
+        Args:
+            node_id: Node with at least one walk edge
+            rng: random.Random (or the ``random`` module)
+
+        Returns:
+            Index of the edge within the node's row (as for :meth:`walk_child`)
+        """
+        lo = int(self.walk_ptr[node_id])
+        k = rng.randrange(int(self.walk_ptr[node_id + 1]) - lo)
+        if rng.random() < self.alias_prob[lo + k]:
+            return k
+        return int(self.alias_index[lo + k])
+
+    def walk_distances_to(self, node_id):
+        """Shortest number of walk steps from every node to ``node_id``.
+
+        Reverse BFS over the walk edges (non-sink, non-self children) using
+        the ``parents`` arrays. Returns an int32 array with -1 for nodes that
+        can't reach ``node_id``; ``node_id`` itself is 0.
+        """
+        dist = np.full(len(self), -1, dtype=np.int32)
+        dist[node_id] = 0
+        frontier = deque([node_id])
+        while frontier:
+            target = frontier.popleft()
+            # walk edges never lead into a sink
+            if self.sink[target]:
+                continue
+            for parent in self.parents_of(target).tolist():
+                if parent != target and dist[parent] < 0:
+                    dist[parent] = dist[target] + 1
+                    frontier.append(parent)
+        return dist
+
+    def walk_parents_mask(self, node_id):
+        """Boolean array marking the nodes that have ``node_id`` as a non-sink child."""
+        mask = np.zeros(len(self), dtype=bool)
+        rows = np.repeat(np.arange(len(self)), np.diff(self.walk_ptr))
+        mask[rows[self.walk_children == node_id]] = True
+        return mask
+
+
+def analysis_fingerprint(arr_dict, max_voice_leading=None, tolerance=0, match="intervals"):
+    """Hash everything the graph is derived from: node order, boundary chords,
+    the matching rules version and options, the graph file format and the
+    voice-leading threshold."""
+    digest = hashlib.sha256(
+        f"rules={MATCH_RULES_VERSION};match={match};tolerance={tolerance};"
+        f"format={GRAPH_FORMAT_VERSION};max_voice_leading={max_voice_leading}".encode()
+    )
+    for name, node in arr_dict.items():
+        key = (
+            name,
+            node["first_chord"]["midi"],
+            node["last_chord"]["midi"],
+            node["transposer"],
+            node.get("aliases"),
+        )
+        digest.update(repr(key).encode())
+    return digest.hexdigest()
+
+
+def load_or_build_graph(
+    arr_dict, graph_path="graph.npz", max_voice_leading=None, tolerance=0, match="intervals"
+):
+    """Load the pruned ProgressionGraph for ``arr_dict`` from disk, or build it.
+
+    The cached graph is reused only if it was built from an analysis with the
+    same fingerprint (see :func:`analysis_fingerprint`). Otherwise connections
+    are built, sinks pruned, and the result is written to ``graph_path``.
+    ``arr_dict`` itself is only filled in with children/parents on a rebuild.
+
+    ``tolerance`` and ``match`` are passed to :func:`build_connections`.
+    With ``max_voice_leading``, connections whose voice-leading distance is
+    larger are dropped before sinks are pruned.
+    """
+    fingerprint = analysis_fingerprint(arr_dict, max_voice_leading, tolerance, match)
+
+    if os.path.exists(graph_path):
+        try:
+            graph = ProgressionGraph.load(graph_path, fingerprint)
+        except Exception as e:
+            print(f"Warning: could not load cached graph ({e}); rebuilding.")
+            graph = None
+        if graph is not None:
+            return graph
+
+    build_connections(arr_dict, tolerance=tolerance, match=match)
+    if max_voice_leading is not None:
+        total = sum(len(node["children"]) for node in arr_dict.values())
+        dropped = drop_rough_connections(arr_dict, max_voice_leading)
+        print(
+            f"Dropped {dropped} of {total} connections with voice-leading distance "
+            f"above {max_voice_leading}."
+        )
+    prune_sinks(arr_dict)
+    build_non_sink_children(arr_dict)
+    graph = ProgressionGraph.from_arr_dict(arr_dict)
+    graph.save(graph_path, fingerprint)
+    return graph
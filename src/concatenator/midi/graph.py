@@ -1,7 +1,75 @@
 """Graph construction and traversal for MIDI progression networks."""
 
+from collections import defaultdict, deque
+from itertools import product
 
-def build_connections(arr_dict):
+# Bump whenever build_connections / prune_sinks change which edges or sinks
+# come out, so persisted graphs built under the old rules are discarded
+MATCH_RULES_VERSION = 1
+
+# What build_connections compares: interval patterns (optionally within a
+# tolerance) or bass-relative pitch-class sets
+MATCH_MODES = ("intervals", "chord-type")
+
+
+def _build_begin_index(arr_dict):
+    """Index progressions by the keys their first chord can be matched on.
+
+    Returns three dicts mapping a key to the positions (in arr_dict order)
+    of the progressions whose first chord has it:
+    - by_pattern: each (T–A, A–S) pair in ``match_patterns``
+    - by_upper: the upper intervals (``intervals[1:]``) of every first chord
+    - by_upper_unpatterned: same, restricted to first chords without patterns
+    """
+    by_pattern = defaultdict(list)
+    by_upper = defaultdict(list)
+    by_upper_unpatterned = defaultdict(list)
+
+    for position, node in enumerate(arr_dict.values()):
+        begin_chord = node["first_chord"]
+        begin_patterns = begin_chord.get("match_patterns", [])
+        upper = tuple(begin_chord["intervals"][1:])
+
+        for pattern in set(begin_patterns):
+            by_pattern[pattern].append(position)
+        by_upper[upper].append(position)
+        if not begin_patterns:
+            by_upper_unpatterned[upper].append(position)
+
+    return by_pattern, by_upper, by_upper_unpatterned
+
+
+def _tolerant_keys(key, tolerance):
+    """Yield (neighbor key, deviation) for every interval key within ``tolerance``.
+
+    Each interval may move by up to ``tolerance`` semitones; the deviation
+    is the largest such move. ``key`` itself comes first, with deviation 0.
+    """
+    yield key, 0
+    if not tolerance or not key:
+        return
+    steps = range(-tolerance, tolerance + 1)
+    for offsets in product(steps, repeat=len(key)):
+        if any(offsets):
+            yield tuple(k + o for k, o in zip(key, offsets)), max(abs(o) for o in offsets)
+
+
+def _add_matches(matches, positions, deviation, tolerance):
+    """Record ``positions`` in ``matches`` unless already matched with a smaller deviation."""
+    for position in positions:
+        if deviation < matches.get(position, tolerance + 1):
+            matches[position] = deviation
+
+
+def chord_type(chord):
+    """Bass-relative pitch-class set of a chord, e.g. (0, 4, 7) for any major triad
+    in root position."""
+    if not chord["midi"]:
+        return ()
+    return tuple(sorted({(p - chord["bass"]) % 12 for p in chord["midi"]}))
+
+
+def build_connections(arr_dict, tolerance=0, match="intervals"):
     """Populate children / parents relationships based on interval matching.
 
     For 4–6 voice chords we allow flexible matching: any contiguous 4-note
@@ -10,31 +78,68 @@ def build_connections(arr_dict):
 
     If either side doesn't have a 4-note window (e.g. 3-voice boundary),
     we fall back to comparing upper intervals derived from the full chord.
+
+    With ``tolerance`` k > 0, intervals may also differ by up to k
+    semitones each. With ``match="chord-type"``, chords match when they
+    have the same bass-relative pitch-class set (see :func:`chord_type`)
+    instead. Each connection's deviation (the largest interval difference
+    it needed, 0 for exact matches) goes into the node's
+    ``child_deviations`` list, parallel to ``children``.
+
+    Rather than testing every pair, first chords are indexed by those keys
+    and each last chord looks up its candidates (enumerating the
+    (2k + 1)^2 neighbors of a pattern under a tolerance), so the cost is
+    proportional to the number of keys looked up plus the number of edges.
+    Children and parents come out in arr_dict order, exactly as a full
+    pairwise scan would give.
     """
+    if match not in MATCH_MODES:
+        raise ValueError(f"Unknown match mode '{match}' (expected one of {MATCH_MODES})")
+
+    names = list(arr_dict)
+    nodes = list(arr_dict.values())
+    if match == "chord-type":
+        by_type = defaultdict(list)
+        for position, node in enumerate(nodes):
+            by_type[chord_type(node["first_chord"])].append(position)
+    else:
+        by_pattern, by_upper, by_upper_unpatterned = _build_begin_index(arr_dict)
+        # only enumerate neighbors of keys that have a chance of being indexed
+        upper_lengths = {len(key) for key in by_upper}
+        unpatterned_lengths = {len(key) for key in by_upper_unpatterned}
+
     for name_1, value_1 in arr_dict.items():
-        for name_2, value_2 in arr_dict.items():
-            begin_chord = value_2["first_chord"]
-            end_chord = value_1["last_chord"]
+        end_chord = value_1["last_chord"]
+        # position -> smallest deviation it was matched with
+        matches = {}
 
-            begin_patterns = begin_chord.get("match_patterns", [])
+        if match == "chord-type":
+            _add_matches(matches, by_type.get(chord_type(end_chord), ()), 0, tolerance)
+        else:
             end_patterns = end_chord.get("match_patterns", [])
+            upper = tuple(end_chord["intervals"][1:])
 
-            matched = False
-
-            if begin_patterns and end_patterns:
-                # 4–6 voice flexible matching: any overlapping 4-voice slice can match
-                for ep in end_patterns:
-                    if ep in begin_patterns:
-                        matched = True
-                        break
-            else:
+            if end_patterns:
+                # 4–6 voice flexible matching: any overlapping 4-voice slice can match;
+                # first chords without patterns still fall back to the upper intervals
+                if len(upper) in unpatterned_lengths:
+                    for key, deviation in _tolerant_keys(upper, tolerance):
+                        _add_matches(
+                            matches, by_upper_unpatterned.get(key, ()), deviation, tolerance
+                        )
+                for ep in set(end_patterns):
+                    for key, deviation in _tolerant_keys(ep, tolerance):
+                        _add_matches(matches, by_pattern.get(key, ()), deviation, tolerance)
+            elif len(upper) in upper_lengths:
                 # fallback: compare upper adjacent intervals (old behavior)
-                if end_chord["intervals"][1:] == begin_chord["intervals"][1:]:
-                    matched = True
+                for key, deviation in _tolerant_keys(upper, tolerance):
+                    _add_matches(matches, by_upper.get(key, ()), deviation, tolerance)
 
-            if matched:
-                value_1["children"].append(name_2)
-                value_2["parents"].append(name_1)
+        deviations = value_1.setdefault("child_deviations", [])
+        for position in sorted(matches):
+            value_1["children"].append(names[position])
+            deviations.append(matches[position])
+            nodes[position]["parents"].append(name_1)
 
 
 def mark_sinks(arr_dict):
@@ -49,10 +154,33 @@ def mark_sinks(arr_dict):
 
 
 def prune_sinks(arr_dict):
-    """Loop mark_sinks over and over again until no new sinks appear."""
-    done = False
-    while not done:
-        done = mark_sinks(arr_dict)
+    """Mark every node that can only lead to sinks (or itself) as a sink.
+
+    Same result as looping :func:`mark_sinks` until nothing changes, but in
+    a single O(V + E) pass: each node counts its children (other than itself)
+    that aren't sinks yet, and whenever a node becomes a sink its parents'
+    counts are decremented through the ``parents`` lists. Nodes whose count
+    reaches zero are sinks in turn.
+    """
+    # count every non-self child up front; sinks (including ones already
+    # marked by an earlier pass) are subtracted as they come off the worklist
+    remaining = {}
+    worklist = deque()
+    for name, node in arr_dict.items():
+        remaining[name] = sum(1 for child in node["children"] if child != name)
+        if remaining[name] == 0 or node.get("sink"):
+            node["sink"] = True
+            worklist.append(name)
+
+    while worklist:
+        name = worklist.popleft()
+        for parent in arr_dict[name]["parents"]:
+            if parent == name or arr_dict[parent].get("sink"):
+                continue
+            remaining[parent] -= 1
+            if remaining[parent] == 0:
+                arr_dict[parent]["sink"] = True
+                worklist.append(parent)
 
 
 def build_non_sink_children(arr_dict):
@@ -63,3 +191,35 @@ def build_non_sink_children(arr_dict):
         for child in node["children"]:
             if child != name and not arr_dict[child].get("sink"):
                 non_sink_children.append(child)
+
+
+def collapse_duplicates(arr_dict):
+    """Collapse progressions that are copies or transpositions of each other.
+
+    Progressions with the same analysis ``fingerprint`` (see
+    :func:`concatenator.midi.smf.progression_summary`) become one node:
+    the first in arr_dict order is kept, and the others are listed in its
+    ``aliases`` as ``[name, offset]`` pairs, where ``offset`` is how many
+    semitones the alias sits above the kept progression. Walks render one of
+    a node's aliases at random; shifting it down by ``offset`` makes it
+    sound where the kept progression would.
+
+    Run this on a fresh analysis, before :func:`build_connections`.
+
+    Returns:
+        A new dict holding only the kept progressions
+    """
+    kept = {}
+    by_fingerprint = {}
+    for name, node in arr_dict.items():
+        fingerprint = node.get("fingerprint")
+        first = by_fingerprint.get(fingerprint) if fingerprint else None
+        if first is None:
+            node["aliases"] = []
+            kept[name] = node
+            if fingerprint:
+                by_fingerprint[fingerprint] = node
+        else:
+            offset = node["first_chord"]["bass"] - first["first_chord"]["bass"]
+            first["aliases"].append([name, offset])
+    return kept
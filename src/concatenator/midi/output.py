@@ -2,24 +2,52 @@
 
 import os
 from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
 
-import graphviz
+import numpy as np
+
+from .compact import ProgressionGraph
+from .smf import write_midi
+
+# graph export format for each file extension
+GRAPH_EXPORT_FORMATS = {
+    ".dot": "dot",
+    ".gv": "dot",
+    ".graphml": "graphml",
+    ".tsv": "edgelist",
+    ".edges": "edgelist",
+    ".txt": "edgelist",
+}
+
+
+def _iter_children(arr_dict):
+    """Yield (name, child names) from an arr_dict or a ProgressionGraph."""
+    if isinstance(arr_dict, ProgressionGraph):
+        names = arr_dict.names
+        for node_id, name in enumerate(names):
+            yield name, [names[child] for child in arr_dict.children_of(node_id)]
+    else:
+        for name, node in arr_dict.items():
+            yield name, node["children"]
 
 
 def render_graph(arr_dict, output_path=None):
     """Create a Graphviz directed graph and optionally save/open it.
 
     Args:
-        arr_dict: Analysis dictionary with children relationships
+        arr_dict: Analysis dictionary with children relationships, or a
+            ProgressionGraph
         output_path: Optional path for output file (without extension)
 
     Returns:
         The graphviz.Digraph object
     """
+    import graphviz
+
     graph = graphviz.Digraph(engine="fdp", graph_attr={"size": "8.5, 11"})
-    for name, node in arr_dict.items():
+    for name, children in _iter_children(arr_dict):
         graph.node(name, name)
-        for child in node["children"]:
+        for child in children:
             graph.edge(name, child)
 
     if output_path:
@@ -30,6 +58,220 @@ def render_graph(arr_dict, output_path=None):
     return graph
 
 
+def _attr_text(value):
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def _dot_id(value):
+    return '"' + _attr_text(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _write_dot(fp, nodes, edges):
+    fp.write("digraph progressions {\n")
+    for node_id, attrs in nodes:
+        fields = " ".join(f"{key}={_dot_id(value)}" for key, value in attrs.items())
+        fp.write(f"  {_dot_id(node_id)} [{fields}];\n")
+    for source, target, attrs in edges:
+        fields = " ".join(f"{key}={_dot_id(value)}" for key, value in attrs.items())
+        fp.write(f"  {_dot_id(source)} -> {_dot_id(target)} [{fields}];\n")
+    fp.write("}\n")
+
+
+def _graphml_type(value):
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "double"
+    return "string"
+
+
+def _graphml_data(scope, attrs):
+    return "".join(
+        f'<data key="{scope}_{key}">'
+        f"{escape(_attr_text(value))}</data>"
+        for key, value in attrs.items()
+    )
+
+
+def _write_graphml(fp, nodes, edges, node_keys, edge_keys):
+    fp.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    fp.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+    for scope, keys in (("node", node_keys), ("edge", edge_keys)):
+        for key, sample in keys.items():
+            fp.write(
+                f'  <key id="{scope}_{key}" for="{scope}" attr.name="{key}" '
+                f'attr.type="{_graphml_type(sample)}"/>\n'
+            )
+    fp.write('  <graph edgedefault="directed">\n')
+    for node_id, attrs in nodes:
+        fp.write(f"    <node id={quoteattr(str(node_id))}>{_graphml_data('node', attrs)}</node>\n")
+    for source, target, attrs in edges:
+        fp.write(
+            f"    <edge source={quoteattr(str(source))} target={quoteattr(str(target))}>"
+            f"{_graphml_data('edge', attrs)}</edge>\n"
+        )
+    fp.write("  </graph>\n</graphml>\n")
+
+
+def _write_edge_list(fp, edges, edge_keys):
+    fp.write("\t".join(["source", "target", *edge_keys]) + "\n")
+    for source, target, attrs in edges:
+        fields = [str(source), str(target), *(_attr_text(v) for v in attrs.values())]
+        fp.write("\t".join(fields) + "\n")
+
+
+def _write_graph_file(output_path, fmt, nodes, edges, node_keys, edge_keys):
+    """Stream nodes and edges to ``output_path`` in ``fmt`` (inferred from the suffix)."""
+    output_path = Path(output_path)
+    if fmt is None:
+        fmt = GRAPH_EXPORT_FORMATS.get(output_path.suffix.lower())
+        if fmt is None:
+            raise ValueError(
+                f"Can't tell the graph format from '{output_path.suffix}' "
+                f"(expected one of {', '.join(GRAPH_EXPORT_FORMATS)})"
+            )
+    if fmt not in ("dot", "graphml", "edgelist"):
+        raise ValueError(f"Unsupported graph format: {fmt}")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as fp:
+        if fmt == "dot":
+            _write_dot(fp, nodes, edges)
+        elif fmt == "graphml":
+            _write_graphml(fp, nodes, edges, node_keys, edge_keys)
+        else:
+            _write_edge_list(fp, edges, edge_keys)
+    return output_path
+
+
+def export_graph(graph, output_path="outputs/graphs/graph.dot", nodes=None, fmt=None):
+    """Write the progression graph as DOT, GraphML or a tab-separated edge list.
+
+    Nodes and edges are streamed straight to the file, with no layout, so
+    this stays fast on the full corpus; lay out a DOT file afterwards with
+    Graphviz (``sfdp`` copes with large graphs) if a picture is needed.
+
+    Nodes are identified by filename and carry their ``label`` (basename),
+    ``dataset`` and ``sink`` flag; edges carry the connection's
+    voice-leading distance (``cost``) and match tolerance (``deviation``).
+
+    Args:
+        graph: ProgressionGraph
+        output_path: Output file; its suffix picks the format unless ``fmt``
+            is given (.dot/.gv, .graphml, .tsv/.edges/.txt)
+        nodes: Node ids to keep (e.g. from
+            :func:`~concatenator.midi.analytics.neighborhood`); only edges
+            between them are written. Default: the whole graph.
+        fmt: "dot", "graphml" or "edgelist"
+
+    Returns:
+        Path to the written file
+    """
+    if nodes is None:
+        keep = np.ones(len(graph), dtype=bool)
+    else:
+        keep = np.zeros(len(graph), dtype=bool)
+        keep[np.asarray(nodes, dtype=np.int64)] = True
+    names = graph.names
+
+    def node_items():
+        for node_id in np.flatnonzero(keep).tolist():
+            name = names[node_id]
+            yield name, {
+                "label": os.path.splitext(os.path.basename(name))[0],
+                "dataset": os.path.basename(os.path.dirname(name)),
+                "sink": bool(graph.sink[node_id]),
+            }
+
+    def edge_items():
+        rows = np.repeat(np.arange(len(graph)), np.diff(graph.children_ptr))
+        selected = np.flatnonzero(keep[rows] & keep[graph.children])
+        for source, target, cost, deviation in zip(
+            rows[selected].tolist(),
+            graph.children[selected].tolist(),
+            graph.children_cost[selected].tolist(),
+            graph.children_deviation[selected].tolist(),
+        ):
+            yield names[source], names[target], {"cost": cost, "deviation": deviation}
+
+    path = _write_graph_file(
+        output_path,
+        fmt,
+        node_items(),
+        edge_items(),
+        {"label": "", "dataset": "", "sink": False},
+        {"cost": 0, "deviation": 0},
+    )
+    print(f"Graph written to: {path}")
+    return path
+
+
+def export_condensation(graph, output_path="outputs/graphs/components.dot", fmt=None):
+    """Write the graph's strongly connected components as one node each.
+
+    Component nodes are numbered as by
+    :func:`~concatenator.midi.analytics.strongly_connected_components` and
+    carry their ``size``, a ``label`` naming one member, and whether they
+    are ``closed`` (a walk can't leave them); an edge stands for ``count``
+    walk edges between two components.
+
+    Args:
+        graph: ProgressionGraph
+        output_path: Output file; its suffix picks the format as in export_graph
+        fmt: "dot", "graphml" or "edgelist"
+
+    Returns:
+        Path to the written file
+    """
+    from .analytics import closed_components, condensation
+
+    labels, count, sources, targets, edge_counts = condensation(graph)
+    sizes = np.bincount(labels, minlength=count)
+    closed = closed_components(graph, labels, count)
+    # first member of each component, for its label
+    members = np.unique(labels, return_index=True)[1]
+
+    def node_items():
+        for component in range(count):
+            size = int(sizes[component])
+            label = os.path.splitext(os.path.basename(graph.names[members[component]]))[0]
+            yield component, {
+                "label": label if size == 1 else f"{label} (+{size - 1})",
+                "size": size,
+                "closed": bool(closed[component]),
+            }
+
+    def edge_items():
+        for source, target, n in zip(sources.tolist(), targets.tolist(), edge_counts.tolist()):
+            yield source, target, {"count": n}
+
+    path = _write_graph_file(
+        output_path,
+        fmt,
+        node_items(),
+        edge_items(),
+        {"label": "", "size": 0, "closed": False},
+        {"count": 0},
+    )
+    print(f"Component graph ({count} components) written to: {path}")
+    return path
+
+
+def render_dot(dot_path, engine="sfdp", fmt="pdf"):
+    """Lay out and render a DOT file written by export_graph with Graphviz.
+
+    Returns:
+        Path to the rendered file
+    """
+    import graphviz
+
+    rendered = graphviz.render(engine, fmt, str(dot_path))
+    print(f"Graph rendered to: {rendered}")
+    return rendered
+
+
 def export_lilypond(part_with_measures, output_path=None):
     """Export a music21 Part to LilyPond format.
 
@@ -76,6 +318,71 @@ def export_musicxml(part_with_measures, output_path=None):
     return output_path
 
 
+def merge_tied_notes(steps):
+    """Turn walk steps into note spans, merging back-to-back repeated pitches.
+
+    A note that starts exactly where the previous note of the same MIDI
+    pitch ended is folded into it, the same notes
+    :func:`~concatenator.midi.walker.add_ties_for_repeated_notes` would tie.
+
+    Args:
+        steps: Iterable of WalkStep (e.g. from iter_walk)
+
+    Returns:
+        ``(notes, markers)``: (onset, end, pitch) spans sorted by onset, and
+        an (offset, label) marker at the start of each step
+    """
+    notes = []
+    markers = []
+    # pitch -> index in notes of its latest span
+    latest = {}
+
+    for step in steps:
+        label = os.path.splitext(os.path.basename(step.name))[0]
+        markers.append((step.offset, label))
+        for offset, duration, pitches, _ in step.events:
+            end = offset + duration
+            for pitch in {int(p) for p in pitches}:
+                i = latest.get(pitch)
+                if i is not None and abs(notes[i][1] - offset) < 1e-6:
+                    notes[i] = (notes[i][0], end, pitch)
+                else:
+                    latest[pitch] = len(notes)
+                    notes.append((offset, end, pitch))
+
+    notes.sort()
+    return notes, markers
+
+
+def export_midi(steps, output_path=None):
+    """Write walk steps straight to a Standard MIDI File.
+
+    Skips the music21 score entirely (no Part, measures or ties): the steps'
+    note events are merged with :func:`merge_tied_notes` and written with
+    :func:`~concatenator.midi.smf.write_midi`, each step's name becoming a
+    text marker.
+
+    Args:
+        steps: Iterable of WalkStep (e.g. from iter_walk)
+        output_path: Path for output .mid file (default: outputs/scores/output.mid)
+
+    Returns:
+        Path to the generated MIDI file
+    """
+    if output_path is None:
+        output_dir = Path("outputs/scores")
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = output_dir / "output.mid"
+    else:
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    notes, markers = merge_tied_notes(steps)
+    write_midi(str(output_path), notes, markers)
+    print(f"MIDI file written to: {output_path}")
+    return output_path
+
+
 def show_musicxml(part_with_measures):
     """Open the score in the default MusicXML viewer (e.g., MuseScore).
 
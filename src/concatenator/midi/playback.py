@@ -0,0 +1,175 @@
+"""Realtime playback of walk steps on a background thread.
+
+Playing a snippet blocks for as long as the music lasts, so doing it inline
+stalls the walk: the next snippet isn't chosen or transposed until the
+previous one has finished sounding, which leaves audible gaps.
+:class:`RealtimePlayback` moves the playing onto a background thread fed by
+a bounded queue. The walker submits each :class:`~concatenator.midi.walker.WalkStep`
+and goes on to compute up to ``prefetch`` steps ahead while audio plays.
+
+The thread hands steps to a *player*, any object with a ``play(step)``
+method that blocks until the step has been heard. :class:`Music21Player`
+sends it to music21's realtime MIDI player; :class:`NullPlayer` only records
+what it was given (optionally taking as long as the music would), for use
+without a MIDI output device.
+"""
+
+import queue
+import threading
+import time
+
+# queue item telling the playback thread to finish
+_STOP = object()
+
+
+def step_stream(step):
+    """Build a music21 Stream holding one WalkStep's events."""
+    from music21 import chord, note, stream, tie
+
+    s = stream.Stream()
+    for offset, duration, pitches, ties in step.events:
+        if len(pitches):
+            el = chord.Chord([int(p) for p in pitches], quarterLength=duration)
+            for n, tie_type in zip(el.notes, ties):
+                if tie_type:
+                    n.tie = tie.Tie(tie_type)
+        else:
+            el = note.Rest(quarterLength=duration)
+        s.insert(offset - step.offset, el)
+    return s
+
+
+class Music21Player:
+    """Play steps through ``music21.midi.realtime.StreamPlayer``."""
+
+    def play(self, step):
+        from music21 import midi
+
+        midi.realtime.StreamPlayer(step_stream(step)).play()
+
+
+class NullPlayer:
+    """Player that records steps instead of sounding them.
+
+    Args:
+        seconds_per_quarter: If set, sleep as long as each step would take
+            to play at this speed, to mimic a real device's timing
+    """
+
+    def __init__(self, seconds_per_quarter=0.0):
+        self.seconds_per_quarter = seconds_per_quarter
+        self.played = []
+
+    def play(self, step):
+        self.played.append(step.name)
+        if self.seconds_per_quarter and step.events:
+            last_offset, last_duration = step.events[-1][:2]
+            length = last_offset + last_duration - step.offset
+            time.sleep(length * self.seconds_per_quarter)
+
+
+class RealtimePlayback:
+    """Play walk steps on a background thread, fed by a bounded lookahead queue.
+
+    ``submit`` returns as soon as the step is queued, blocking only when
+    ``prefetch`` steps are already waiting. Each time the thread finishes a
+    step and finds nothing queued while the walk is still running, that is
+    an *underrun* (an audible gap); :meth:`stats` reports how many there
+    were and how long playback sat idle in total.
+
+    Args:
+        player: Object with a blocking ``play(step)`` method
+            (default: Music21Player)
+        prefetch: Maximum number of steps computed ahead of playback
+    """
+
+    def __init__(self, player=None, prefetch=4):
+        if prefetch < 1:
+            raise ValueError("prefetch must be at least 1")
+        self.player = player if player is not None else Music21Player()
+        self.prefetch = prefetch
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._thread = None
+        self._error = None
+        self.played = 0
+        self.underruns = 0
+        self.underrun_seconds = 0.0
+        self.max_queued = 0
+
+    def start(self):
+        """Start the playback thread (done automatically by ``submit``)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="playback", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, step):
+        """Queue a step for playback, waiting while the queue is full."""
+        self.start()
+        while True:
+            if self._error is not None:
+                raise RuntimeError("Playback thread failed") from self._error
+            try:
+                self._queue.put(step, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.max_queued = max(self.max_queued, self._queue.qsize())
+
+    def close(self, wait=True):
+        """Signal the end of the walk and, with ``wait``, let the queue drain."""
+        if self._thread is None:
+            return
+        if not wait:
+            # drop whatever hasn't started playing yet
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+        while self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            raise RuntimeError("Playback thread failed") from self._error
+
+    def stats(self):
+        """Return playback counters as a dict."""
+        return {
+            "played": self.played,
+            "underruns": self.underruns,
+            "underrun_seconds": self.underrun_seconds,
+            "max_queued": self.max_queued,
+            "prefetch": self.prefetch,
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(wait=exc_type is None)
+
+    def _run(self):
+        while True:
+            try:
+                step = self._queue.get_nowait()
+            except queue.Empty:
+                waited = time.perf_counter()
+                step = self._queue.get()
+                # the first step and the end-of-walk signal aren't gaps
+                if self.played and step is not _STOP:
+                    self.underruns += 1
+                    self.underrun_seconds += time.perf_counter() - waited
+            if step is _STOP:
+                return
+            try:
+                self.player.play(step)
+            except Exception as e:
+                self._error = e
+                return
+            self.played += 1
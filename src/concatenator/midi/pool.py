@@ -0,0 +1,187 @@
+"""Render many walks in one run, optionally across a process pool.
+
+The corpus analysis and the progression graph are loaded once and handed
+to each worker process when it starts. Every walk then draws from its own
+``random.Random``, seeded from a base seed and the walk's index
+(:func:`walk_seeds`), so a batch comes out the same whatever the number of
+workers, and walk ``i`` doesn't depend on how many walks were requested.
+"""
+
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .analyzer import _resolve_workers
+from .bank import ProgressionBank
+from .output import export_lilypond, export_midi, export_musicxml
+from .walker import _part_from_steps, iter_walk
+
+# file extension written for each batch output format
+OUTPUT_SUFFIXES = {"lilypond": ".ly", "musicxml": ".musicxml", "midi": ".mid"}
+
+# per-process state set up by _init_worker
+_worker = {}
+
+
+def walk_seeds(base_seed, count):
+    """Derive an independent seed for each of ``count`` walks.
+
+    Seeds come from ``np.random.SeedSequence(base_seed).spawn``, so walk
+    ``i`` gets the same seed for any ``count`` greater than ``i``.
+    """
+    children = np.random.SeedSequence(base_seed).spawn(count)
+    return [int(child.generate_state(1, np.uint64)[0]) for child in children]
+
+
+def _init_worker(graph, bank_path):
+    _worker["graph"] = graph
+    bank = ProgressionBank(bank_path) if bank_path else None
+    # same check as load_or_compile_bank: never render from a bank that no
+    # longer matches the graph's files
+    if bank is not None and not bank.is_current(graph.rendered_names()):
+        print(f"Warning: progression bank {bank_path} is stale; rendering from the MIDI files.")
+        bank = None
+    _worker["bank"] = bank
+
+
+def _render_walk(task):
+    """Generate and write one walk; return its summary entry."""
+    (
+        index,
+        seed,
+        start_name,
+        target_progressions,
+        steer,
+        weighted,
+        output_format,
+        output_path,
+    ) = task
+    graph = _worker["graph"]
+    bank = _worker["bank"]
+    rng = random.Random(seed)
+    began = time.perf_counter()
+
+    labels = []
+    nodes = []
+
+    def steps():
+        for step in iter_walk(
+            graph,
+            start_name,
+            target_progressions,
+            steer=steer,
+            bank=bank,
+            rng=rng,
+            weighted=weighted,
+        ):
+            labels.append(os.path.splitext(os.path.basename(step.name))[0])
+            nodes.append(step.node)
+            yield step
+
+    if output_format == "midi":
+        export_midi(steps(), output_path)
+    else:
+        part = _part_from_steps(steps())
+        if output_format == "lilypond":
+            export_lilypond(part, output_path)
+        else:
+            export_musicxml(part, output_path)
+
+    return {
+        "index": index,
+        "seed": seed,
+        "output": str(output_path),
+        "steps": len(labels),
+        "closed": len(nodes) > 1 and nodes[-1] == graph.node_id(start_name),
+        "progressions": labels,
+        "seconds": round(time.perf_counter() - began, 3),
+    }
+
+
+def generate_walks(
+    graph,
+    start_name,
+    count,
+    target_progressions=100,
+    seed=None,
+    jobs=1,
+    output_dir="outputs/scores/batch",
+    output_format="midi",
+    steer=True,
+    bank_path=None,
+    weighted=False,
+):
+    """Render ``count`` walks from ``start_name`` and write a JSON summary.
+
+    Args:
+        graph: ProgressionGraph
+        start_name: Starting MIDI filename, shared by every walk
+        count: Number of walks
+        target_progressions: Target number of progressions per walk (approximate)
+        seed: Base seed (None = fresh entropy, recorded in the summary)
+        jobs: Worker processes (None or 1 = serial, 0 = one per CPU)
+        output_dir: Directory for the walks (walk_000.mid, ...) and summary.json
+        output_format: "midi" (default), "lilypond" or "musicxml"
+        steer: Steer each walk back to start_name, as in random_walk
+        bank_path: Optional compiled ProgressionBank, opened once per worker
+        weighted: Follow the graph's walk weights instead of drawing uniformly
+
+    Returns:
+        The summary dict that was written to ``output_dir/summary.json``
+    """
+    if output_format not in OUTPUT_SUFFIXES:
+        raise ValueError(f"Unsupported batch output format: {output_format}")
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    width = max(3, len(str(count - 1)))
+    suffix = OUTPUT_SUFFIXES[output_format]
+    tasks = [
+        (
+            i,
+            walk_seed,
+            start_name,
+            target_progressions,
+            steer,
+            weighted,
+            output_format,
+            output_dir / f"walk_{i:0{width}d}{suffix}",
+        )
+        for i, walk_seed in enumerate(walk_seeds(seed, count))
+    ]
+
+    jobs = min(_resolve_workers(jobs), max(1, count))
+    began = time.perf_counter()
+    if jobs == 1:
+        _init_worker(graph, bank_path)
+        walks = [_render_walk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(graph, bank_path)
+        ) as executor:
+            walks = list(executor.map(_render_walk, tasks))
+
+    summary = {
+        "start": start_name,
+        "count": count,
+        "seed": seed,
+        "target_progressions": target_progressions,
+        "steer": steer,
+        "weighted": weighted,
+        "output_format": output_format,
+        "jobs": jobs,
+        "seconds": round(time.perf_counter() - began, 3),
+        "walks": walks,
+    }
+    summary_path = output_dir / "summary.json"
+    with open(summary_path, "w") as fp:
+        json.dump(summary, fp, indent=2)
+    print(f"Summary of {count} walks written to: {summary_path}")
+    return summary
@@ -0,0 +1,366 @@
+"""Minimal Standard MIDI File reader and writer.
+
+The analyzer only needs the opening and closing simultaneities of each
+progression, so parsing a whole file into music21 and chordifying it is
+mostly wasted work. This module scans the raw note-on / note-off events
+instead and rebuilds just those two chords, following music21's MIDI import
+rules (note pairing, 16th/triplet quantization) closely enough that the
+results match ``converter.parse(...).chordify()``.
+
+:func:`write_midi` goes the other way for walk output: it writes plain note
+spans straight to a single-track file, without building a music21 score.
+"""
+
+import hashlib
+import math
+import struct
+from fractions import Fraction
+
+# music21's default quantization grid: 16ths and 8th-note triplets
+QUARTER_LENGTH_DIVISORS = (4, 3)
+
+# 0-based channel 10, which music21 imports as unpitched percussion
+_PERCUSSION_CHANNEL = 9
+
+# defaults for written files: music21's tempo and velocity, Viola (GM program 42)
+DEFAULT_TICKS_PER_QUARTER = 960
+DEFAULT_BPM = 120
+DEFAULT_VELOCITY = 90
+DEFAULT_PROGRAM = 41
+
+# number of data bytes following each channel-voice status nibble
+_DATA_BYTES = {0x8: 2, 0x9: 2, 0xA: 2, 0xB: 2, 0xC: 1, 0xD: 1, 0xE: 2}
+
+
+class MidiFormatError(ValueError):
+    """Raised when a file is not a Standard MIDI File we can read."""
+
+
+def _read_varlen(data, pos):
+    """Decode a variable-length quantity; return (value, new_pos)."""
+    value = 0
+    while True:
+        if pos >= len(data):
+            raise MidiFormatError("truncated variable-length quantity")
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _iter_chunks(data):
+    """Yield (chunk_type, chunk_bytes) for every chunk in the file."""
+    pos = 0
+    while pos + 8 <= len(data):
+        chunk_type = data[pos : pos + 4]
+        (length,) = struct.unpack(">I", data[pos + 4 : pos + 8])
+        pos += 8
+        yield chunk_type, data[pos : pos + length]
+        pos += length
+
+
+def _track_note_events(track):
+    """Return [(tick, is_on, pitch, channel)] for the note events in a track."""
+    events = []
+    tick = 0
+    pos = 0
+    status = None
+
+    while pos < len(track):
+        delta, pos = _read_varlen(track, pos)
+        tick += delta
+
+        byte = track[pos]
+        if byte == 0xFF:
+            # meta event: type byte, length, payload
+            length, pos = _read_varlen(track, pos + 2)
+            pos += length
+            continue
+        if byte in (0xF0, 0xF7):
+            # sysex
+            length, pos = _read_varlen(track, pos + 1)
+            pos += length
+            continue
+
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        elif status is None:
+            raise MidiFormatError("running status without a preceding status byte")
+
+        kind = status >> 4
+        n_data = _DATA_BYTES.get(kind)
+        if n_data is None:
+            raise MidiFormatError(f"unexpected status byte 0x{status:02X}")
+        payload = track[pos : pos + n_data]
+        pos += n_data
+
+        if kind in (0x8, 0x9) and len(payload) == 2:
+            pitch, velocity = payload
+            is_on = kind == 0x9 and velocity > 0
+            events.append((tick, is_on, pitch, status & 0x0F))
+
+    return events
+
+
+def _pair_notes(events):
+    """Pair note-ons with note-offs the way music21 does.
+
+    Each note-on takes the first matching note-off (same pitch and channel)
+    that follows it; note-ons that are never released are dropped.
+
+    Returns:
+        List of (on_tick, off_tick, pitch, channel) sorted by on_tick.
+    """
+    notes = []
+    awaiting_off = {}
+    for tick, is_on, pitch, channel in reversed(events):
+        if not is_on:
+            awaiting_off[pitch, channel] = tick
+        elif (pitch, channel) in awaiting_off:
+            notes.append((tick, awaiting_off[pitch, channel], pitch, channel))
+    notes.reverse()
+    return notes
+
+
+def _group_chords(notes, ticks_per_quarter):
+    """Gather notes into chords the way music21's MIDI import does.
+
+    Notes starting within one quantization unit of a group's first note, and
+    ending within one unit of its release, join that group. The group sits
+    at its first note's onset and takes the length of its last member.
+    Percussion-channel groups are dropped, since music21 imports them as
+    unpitched and they never reach ``chordify``.
+
+    Returns:
+        List of (on_tick, off_tick, pitches) sorted by on_tick.
+    """
+    tolerance = ticks_per_quarter / max(QUARTER_LENGTH_DIVISORS)
+    gathered = [False] * len(notes)
+    elements = []
+
+    for i, (on, off, pitch, channel) in enumerate(notes):
+        if gathered[i]:
+            continue
+        group = [notes[i]]
+        for j in range(i + 1, len(notes)):
+            if abs(notes[j][0] - on) >= tolerance:
+                break
+            if abs(notes[j][1] - off) > tolerance:
+                continue
+            group.append(notes[j])
+            gathered[j] = True
+
+        if any(member[3] == _PERCUSSION_CHANNEL for member in group):
+            continue
+        last_on, last_off = group[-1][:2]
+        elements.append((on, on + last_off - last_on, tuple(m[2] for m in group)))
+
+    return elements
+
+
+def parse_midi_notes(data):
+    """Parse the notes of a Standard MIDI File already read into memory.
+
+    Args:
+        data: Contents of a .mid / .midi file, as bytes
+
+    Returns:
+        A ``(ticks_per_quarter, tracks)`` tuple, where ``tracks`` holds one
+        list of (on_tick, off_tick, pitches) note/chord events per track.
+
+    Raises:
+        MidiFormatError: If the data is not a readable SMF
+    """
+    if data[:4] != b"MThd" or len(data) < 14:
+        raise MidiFormatError("missing MThd header")
+    _fmt, _n_tracks, division = struct.unpack(">HHH", data[8:14])
+    if division & 0x8000:
+        raise MidiFormatError("SMPTE time division is not supported")
+
+    tracks = []
+    for chunk_type, chunk in _iter_chunks(data):
+        if chunk_type == b"MTrk":
+            notes = _pair_notes(_track_note_events(chunk))
+            tracks.append(_group_chords(notes, division))
+    return division, tracks
+
+
+def _best_match(target, zero_allowed=True, gap_to_fill=0):
+    """Snap ``target`` (a Fraction of quarter lengths) to the closest grid.
+
+    Mirrors ``music21.stream.Stream.quantize``: candidates are ranked by the
+    gap they would leave before the next onset, then by error, then by grid
+    size. Arithmetic is exact so that snapped values compare cleanly.
+    """
+    found = []
+    for div in QUARTER_LENGTH_DIVISORS:
+        tick = Fraction(1, div)
+        # exact halves round down, as in music21.common.nearestMultiple
+        match = math.ceil(target / tick - Fraction(1, 2)) * tick
+        if not zero_allowed and match == 0:
+            match = tick
+        error = abs(target - match)
+        if gap_to_fill % tick == 0:
+            remaining_gap = 0
+        else:
+            remaining_gap = max(gap_to_fill - match, 0)
+        found.append((remaining_gap, error, tick, match))
+    return min(found)[3]
+
+
+def _quantize_track(elements, ticks_per_quarter):
+    """Return [(onset, end, pitches)] in quantized quarter lengths for a track."""
+    onsets = [_best_match(Fraction(on, ticks_per_quarter)) for on, _, _ in elements]
+
+    quantized = []
+    next_index = 0
+    for i, (on, off, pitches) in enumerate(elements):
+        onset = onsets[i]
+        # look ahead to the next onset that doesn't coincide with this one
+        next_index = max(next_index, i + 1)
+        while next_index < len(elements) and onsets[next_index] <= onset:
+            next_index += 1
+
+        ql = Fraction(max(off - on, 0), ticks_per_quarter)
+        if next_index < len(elements):
+            duration = _best_match(ql, False, onsets[next_index] - onset)
+        else:
+            duration = _best_match(ql, False)
+        quantized.append((onset, onset + duration, pitches))
+    return quantized
+
+
+def _quantized_events(ticks_per_quarter, tracks):
+    """Quantized (onset, end, pitches) events of all tracks."""
+    return [e for track in tracks for e in _quantize_track(track, ticks_per_quarter)]
+
+
+def _boundaries(events):
+    """First and last sounding simultaneities of quantized events.
+
+    These are the pitch sets music21 would put in the first and last
+    ``Chord`` of ``converter.parse(path).chordify()``, as sorted lists of
+    distinct MIDI pitches; both are empty if there are no events.
+    """
+    if not events:
+        return [], []
+
+    start = min(onset for onset, _, _ in events)
+    first = {p for onset, _, pitches in events if onset == start for p in pitches}
+
+    # the last chordify slice starts at the latest onset/release before the end
+    end = max(stop for _, stop, _ in events)
+    last_start = max(t for onset, stop, _ in events for t in (onset, stop) if t < end)
+    last = {p for onset, stop, pitches in events if onset <= last_start < stop for p in pitches}
+
+    return sorted(first), sorted(last)
+
+
+def _fingerprint(events):
+    """Transposition-normalized fingerprint of quantized events.
+
+    The events are sorted and rewritten relative to the first onset and to
+    the bass of the opening chord, so exact copies and transpositions of a
+    progression share a fingerprint. Returns a hex digest, or None if
+    there are no events.
+    """
+    events = sorted((onset, end, tuple(sorted(pitches))) for onset, end, pitches in events)
+    if not events:
+        return None
+
+    start = events[0][0]
+    bass = min(p for onset, _, pitches in events if onset == start for p in pitches)
+    normalized = [
+        (str(onset - start), str(end - onset), tuple(p - bass for p in pitches))
+        for onset, end, pitches in events
+    ]
+    return hashlib.sha1(repr(normalized).encode()).hexdigest()
+
+
+def progression_summary(data):
+    """Boundary chords and fingerprint of a MIDI file, from a single parse.
+
+    Args:
+        data: Contents of a .mid / .midi file, as bytes
+
+    Returns:
+        ``((first_midi, last_midi), fingerprint)``: the first and last
+        sounding simultaneities (see _boundaries) and the transposition-
+        normalized fingerprint (see _fingerprint), None if there are no notes
+
+    Raises:
+        MidiFormatError: If the data is not a readable SMF
+    """
+    events = _quantized_events(*parse_midi_notes(data))
+    return _boundaries(events), _fingerprint(events)
+
+
+def _write_varlen(value):
+    """Encode a variable-length quantity."""
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+
+def write_midi(
+    path,
+    notes,
+    markers=(),
+    ticks_per_quarter=DEFAULT_TICKS_PER_QUARTER,
+    bpm=DEFAULT_BPM,
+    program=DEFAULT_PROGRAM,
+    velocity=DEFAULT_VELOCITY,
+):
+    """Write note spans to a format-0 Standard MIDI File.
+
+    Args:
+        path: Output path
+        notes: Iterable of (onset, end, pitch), times in quarter lengths
+        markers: Iterable of (offset, text) written as text meta events
+        ticks_per_quarter: Time division of the file
+        bpm: Tempo
+        program: General MIDI program (0-based) for channel 1
+        velocity: Note-on velocity
+
+    Returns:
+        Number of notes written
+    """
+
+    def ticks(ql):
+        return int(round(ql * ticks_per_quarter))
+
+    # (tick, order, bytes): at equal ticks, meta events, then note-offs, then note-ons
+    events = [
+        (0, 0, b"\xff\x51\x03" + struct.pack(">I", round(60_000_000 / bpm))[1:]),
+        (0, 0, bytes([0xC0, program])),
+    ]
+    for offset, text in markers:
+        data = text.encode("utf-8")
+        events.append((ticks(offset), 0, b"\xff\x01" + _write_varlen(len(data)) + data))
+
+    count = 0
+    for onset, end, pitch in notes:
+        on, off = ticks(onset), ticks(end)
+        if off <= on:
+            continue
+        events.append((on, 2, bytes([0x90, pitch, velocity])))
+        events.append((off, 1, bytes([0x80, pitch, 0])))
+        count += 1
+    events.sort(key=lambda e: e[:2])
+
+    track = bytearray()
+    last = 0
+    for tick, _, data in events:
+        track += _write_varlen(tick - last) + data
+        last = tick
+    track += b"\x00\xff\x2f\x00"
+
+    with open(path, "wb") as fp:
+        fp.write(b"MThd" + struct.pack(">IHHH", 6, 0, 1, ticks_per_quarter))
+        fp.write(b"MTrk" + struct.pack(">I", len(track)) + bytes(track))
+    return count
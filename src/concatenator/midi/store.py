@@ -0,0 +1,201 @@
+"""Versioned, memory-mapped store for the corpus analysis.
+
+The analysis cache holds one entry per MIDI file: its size and mtime (to
+notice changes), the backend that analyzed it and, for usable files, the
+boundary-chord voicings and content fingerprint. Every other field of a
+node (intervals, voices, match patterns, transposer) is derived from the
+voicings by :func:`~concatenator.midi.analyzer.build_intervals_from_midi`,
+so only those are stored, column by column:
+
+- ``name_ptr``/``name_bytes``: string table of NUL-terminated UTF-8 filenames
+- ``size``, ``mtime_ns``, ``backend`` (index into ANALYSIS_BACKENDS) and
+  ``usable`` (False for files that were skipped)
+- ``first_ptr``/``first_midi`` and ``last_ptr``/``last_midi``: CSR voicings
+- ``fingerprint``: fixed-width hex digests (empty when there is none)
+
+The file uses the progression bank's layout (magic, JSON header, aligned
+arrays), so opening it only parses the header and maps the columns; nodes
+are rebuilt on demand, for all files or just the ones asked for. Nothing is
+unpickled, so a store copied from another machine can't run code.
+"""
+
+from functools import cached_property
+
+import numpy as np
+
+from .analyzer import ANALYSIS_BACKENDS, ANALYSIS_CACHE_VERSION, chord_fields
+from .bank import _map_array_file, _write_array_file
+
+STORE_MAGIC = b"CCANALYS"
+
+# width of the stored fingerprints (hex SHA-1)
+_FINGERPRINT_WIDTH = 40
+
+
+def _csr(lists, dtype):
+    ptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(values) for values in lists], out=ptr[1:])
+    flat = np.fromiter((v for values in lists for v in values), dtype=dtype, count=int(ptr[-1]))
+    return ptr, flat
+
+
+def write_analysis_store(path, entries):
+    """Write analysis cache entries to ``path``.
+
+    Args:
+        path: Output path
+        entries: ``{name: {"signature": (size, mtime_ns), "backend": str,
+            "node": dict or None}}``, as kept by load_or_build_analysis
+    """
+    names = list(entries)
+    name_ptr, name_bytes = _csr([name.encode() + b"\0" for name in names], np.uint8)
+
+    nodes = [entries[name]["node"] for name in names]
+    first = [node["first_chord"]["midi"] if node else () for node in nodes]
+    last = [node["last_chord"]["midi"] if node else () for node in nodes]
+    first_ptr, first_midi = _csr(first, np.int16)
+    last_ptr, last_midi = _csr(last, np.int16)
+
+    arrays = {
+        "name_ptr": name_ptr,
+        "name_bytes": name_bytes,
+        "size": np.array([entries[n]["signature"][0] for n in names], dtype=np.int64),
+        "mtime_ns": np.array([entries[n]["signature"][1] for n in names], dtype=np.int64),
+        "backend": np.array(
+            [ANALYSIS_BACKENDS.index(entries[n]["backend"]) for n in names], dtype=np.int8
+        ),
+        "usable": np.array([node is not None for node in nodes], dtype=bool),
+        "first_ptr": first_ptr,
+        "first_midi": first_midi,
+        "last_ptr": last_ptr,
+        "last_midi": last_midi,
+        "fingerprint": np.array(
+            [(node.get("fingerprint") or "") if node else "" for node in nodes],
+            dtype=f"S{_FINGERPRINT_WIDTH}",
+        ),
+    }
+    header = {"version": ANALYSIS_CACHE_VERSION, "count": len(names)}
+    _write_array_file(path, STORE_MAGIC, header, arrays)
+
+
+class AnalysisStore:
+    """Read-only, memory-mapped view of an analysis store.
+
+    Entry ``i`` is the file ``names[i]``; its columns are the arrays
+    described in the module docstring.
+
+    Raises:
+        ValueError: If ``path`` isn't an analysis store, or was written with
+            a different ANALYSIS_CACHE_VERSION
+    """
+
+    def __init__(self, path):
+        header, arrays = _map_array_file(path, STORE_MAGIC, "an analysis store")
+        if header["version"] != ANALYSIS_CACHE_VERSION:
+            raise ValueError(
+                f"analysis store version {header['version']} "
+                f"(expected {ANALYSIS_CACHE_VERSION})"
+            )
+
+        self.path = path
+        for key, arr in arrays.items():
+            # plain ndarray views of the maps: much cheaper to index than np.memmap
+            setattr(self, key, np.asarray(arr))
+
+        count = header["count"]
+        if len(self.name_ptr) != count + 1 or len(self.name_bytes) != self.name_ptr[-1]:
+            raise ValueError(f"{path} is truncated or inconsistent")
+        self.names = self.name_bytes.tobytes().decode().split("\0")[:-1]
+
+    @cached_property
+    def index(self):
+        """``{name: entry number}``, built on first use."""
+        return {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def signature(self, i):
+        """(size, mtime_ns) recorded for entry ``i``."""
+        return int(self.size[i]), int(self.mtime_ns[i])
+
+    def node(self, i):
+        """Rebuild the analysis node for entry ``i`` (None if it was skipped)."""
+        return self.entries([self.names[i]])[self.names[i]]["node"]
+
+    def entries(self, names=None):
+        """Return cache entries for ``names`` (default: all) found in the store.
+
+        Only the requested rows are turned into Python objects, so reading a
+        few entries from a large store stays cheap.
+
+        Returns:
+            ``{name: {"signature", "backend", "node"}}`` in the given order;
+            names not in the store are left out
+        """
+        if names is None:
+            names = self.names
+            rows = np.arange(len(names))
+        else:
+            index = self.index
+            names = [name for name in names if name in index]
+            rows = np.fromiter((index[name] for name in names), dtype=np.int64, count=len(names))
+
+        size = self.size[rows].tolist()
+        mtime_ns = self.mtime_ns[rows].tolist()
+        backend = self.backend[rows].tolist()
+        usable = self.usable[rows].tolist()
+        fingerprint = self.fingerprint[rows].tolist()
+        first = _voicings(self.first_ptr, self.first_midi, rows, usable)
+        last = _voicings(self.last_ptr, self.last_midi, rows, usable)
+
+        return _entries(names, size, mtime_ns, backend, usable, fingerprint, first, last)
+
+
+def _entries(names, size, mtime_ns, backend, usable, fingerprint, first, last):
+    """Assemble cache entries from the row values gathered by AnalysisStore.entries."""
+    entries = {}
+    for k, name in enumerate(names):
+        node = None
+        if usable[k]:
+            first_chord = chord_fields(*first[k])
+            last_chord = chord_fields(*last[k])
+            node = {
+                "children": [],
+                "parents": [],
+                "first_chord": first_chord,
+                "last_chord": last_chord,
+                "transposer": last_chord["bass"] - first_chord["bass"],
+                "fingerprint": fingerprint[k].decode() or None,
+            }
+        entries[name] = {
+            "signature": (size[k], mtime_ns[k]),
+            "backend": ANALYSIS_BACKENDS[backend[k]],
+            "node": node,
+        }
+    return entries
+
+
+def _voicings(ptr, midi, rows, usable):
+    """Return ``(midi list, intervals tuple)`` for each of ``rows`` (None where not usable).
+
+    The intervals are diffed for all requested rows in one numpy pass.
+    """
+    lo, hi = ptr[rows], ptr[rows + 1]
+    counts = hi - lo
+    # gather the rows' pitches into one flat array
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    pitches = midi[starts + np.arange(counts.sum())]
+    diffs = np.diff(pitches).tolist()
+    pitches = pitches.tolist()
+
+    voicings = []
+    pos = 0
+    for count, ok in zip(counts.tolist(), usable):
+        end = pos + count
+        voicings.append((pitches[pos:end], tuple(diffs[pos : end - 1])) if ok else None)
+        pos = end
+    return voicings
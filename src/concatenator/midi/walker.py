@@ -2,10 +2,102 @@
 
 import os
 import random
+from collections import namedtuple
+from fractions import Fraction
 
-from music21 import chord, expressions, instrument, midi, note, stream, tie
+import numpy as np
 
 from .analyzer import get_parsed
+from .bank import TIE_TYPES, element_events, first_measure, snippet_elements
+from .batch import walk_bounds
+from .compact import ProgressionGraph
+from .playback import RealtimePlayback
+
+# How many times a weighted draw that fails the steering constraint is
+# redrawn before the allowed edges are sampled exactly
+_WEIGHTED_REDRAWS = 8
+
+WalkStep = namedtuple("WalkStep", "index node name offset shift events elements")
+WalkStep.__doc__ = """One progression chosen by :func:`iter_walk`.
+
+index is the 0-based step number, node is the progression's graph node and
+name the file rendered for it (one of the node's collapsed duplicates, if it
+has any), offset is where the snippet starts on the walk's timeline (quarter
+lengths) and shift the total semitone transposition applied to it. events
+lists the snippet as (offset, duration, pitches, ties) tuples, with absolute
+offsets, an int array of MIDI pitches (empty for a rest) and the matching
+tie types. elements holds the transposed, chordified music21 objects when
+the snippet was parsed, or None when it came from a ProgressionBank.
+"""
+
+
+def _tie_pair(prev_note, n):
+    """Tie ``prev_note`` into ``n``, extending any tie chain it already ends."""
+    from music21 import tie
+
+    if prev_note.tie is None:
+        prev_note.tie = tie.Tie("start")
+    elif prev_note.tie.type in ("stop", "end"):
+        prev_note.tie = tie.Tie("continue")
+    else:
+        prev_note.tie.type = "continue"
+
+    if n.tie is None:
+        n.tie = tie.Tie("stop")
+    else:
+        n.tie.type = "stop"
+
+
+def tie_repeated_notes(elements, offset, carry=None):
+    """
+    Tie immediately consecutive occurrences of each MIDI pitch within a run
+    of elements laid end to end from ``offset``.
+
+    ``carry`` holds the notes still open from the run before (see Returns),
+    so calling this once per snippet while a walk is assembled gives the
+    same ties as :func:`add_ties_for_repeated_notes` on the finished Part:
+    across each join only the previous snippet's final notes are compared
+    with the new one's, and the work per snippet doesn't grow with the
+    length of the score.
+
+    Args:
+        elements: Chords, notes and rests in time order, without gaps
+        offset: Offset of the first element
+        carry: Dict returned by the previous call (None for the first run)
+
+    Returns:
+        ``{midi: (note, end)}`` for the notes ending where the run ends,
+        to pass as ``carry`` for the next run
+    """
+    from music21 import chord, note
+
+    prev_by_midi = dict(carry) if carry else {}
+
+    for el in elements:
+        end = offset + el.quarterLength
+
+        if isinstance(el, chord.Chord):
+            notes_iter = el.notes
+        elif isinstance(el, note.Note):
+            notes_iter = [el]
+        else:
+            notes_iter = []
+
+        for n in notes_iter:
+            midi_val = n.pitch.midi
+            prev = prev_by_midi.get(midi_val)
+
+            # If the previous note of this MIDI pitch ends exactly where this starts,
+            # add a tie between them.
+            if prev is not None and abs(prev[1] - offset) < 1e-6:
+                _tie_pair(prev[0], n)
+
+            prev_by_midi[midi_val] = (n, end)
+
+        offset = end
+
+    # anything ending earlier can't touch the next run
+    return {m: prev for m, prev in prev_by_midi.items() if abs(prev[1] - offset) < 1e-6}
 
 
 def add_ties_for_repeated_notes(part_stream):
@@ -15,6 +107,8 @@ def add_ties_for_repeated_notes(part_stream):
 
     Works for both Chord and Note objects.
     """
+    from music21 import chord
+
     s = part_stream
     flat = s.flatten()  # global timeline
 
@@ -37,81 +131,147 @@ def add_ties_for_repeated_notes(part_stream):
             # If the previous note of this MIDI pitch ends exactly where this starts,
             # add a tie between them.
             if prev_end is not None and abs(prev_end - offset) < 1e-6:
-                prev_note = prev_note_by_midi[midi_val]
-
-                if prev_note.tie is None:
-                    prev_note.tie = tie.Tie("start")
-                elif prev_note.tie.type in ("stop", "end"):
-                    prev_note.tie = tie.Tie("continue")
-                else:
-                    prev_note.tie.type = "continue"
-
-                if n.tie is None:
-                    n.tie = tie.Tie("stop")
-                else:
-                    n.tie.type = "stop"
+                _tie_pair(prev_note_by_midi[midi_val], n)
 
             prev_note_by_midi[midi_val] = n
             prev_end_by_midi[midi_val] = end
 
 
-def random_walk(arr_dict, start_name, target_progressions=100, enable_playback=True,
-                output_format="lilypond", output_path=None):
+def _elements_from_events(events):
+    """Build music21 chords/rests from WalkStep events."""
+    from music21 import chord, note, tie
+
+    elements = []
+    for _, duration, pitches, ties in events:
+        if len(pitches):
+            el = chord.Chord(pitches.tolist(), quarterLength=duration)
+            for n, tie_type in zip(el.notes, ties):
+                if tie_type:
+                    n.tie = tie.Tie(tie_type)
+        else:
+            el = note.Rest(quarterLength=duration)
+        elements.append(el)
+    return elements
+
+
+def _steer_mask(current, candidates, dist, num_steps, min_steps, max_steps):
+    """Mark the ``candidates`` from which the loop can still close in time.
+
+    ``dist`` holds each node's shortest distance back to the start (-1 if it
+    can't get there). Before ``min_steps`` any candidate that can still reach
+    the start by ``max_steps`` is allowed; from ``min_steps`` on, only ones
+    that get strictly closer. Returns None if none qualify (e.g. the start
+    can't be reached from here at all), meaning every candidate is allowed.
     """
-    Walk through the graph of progressions and build a score.
+    remaining = dist[candidates]
+    allowed = (remaining >= 0) & (num_steps + 1 + remaining <= max_steps)
+    if num_steps >= min_steps and dist[current] > 0:
+        allowed &= remaining < dist[current]
+    if allowed.any():
+        return allowed
+    return None
 
-    We treat target_progressions as a *hint*:
-    - Try to get back to start_name after roughly that many steps.
-    - The final progression in the output is start_name again (so it's loopable).
+
+def _weighted_step(graph, current, allowed, rng):
+    """Draw the next node from ``current``'s walk edges in proportion to their weights.
+
+    The alias table makes each draw O(1); a draw outside ``allowed`` (the
+    steering mask, None = anything goes) is redrawn a few times, then the
+    allowed edges are sampled exactly by their cumulative weights.
+    """
+    for _ in range(_WEIGHTED_REDRAWS):
+        k = graph.sample_walk_child(current, rng)
+        if allowed is None or allowed[k]:
+            return graph.walk_child(current, k)
+
+    weights = np.cumsum(np.where(allowed, graph.walk_weights_of(current), 0.0))
+    if weights[-1] <= 0:
+        # every allowed edge has zero weight: fall back to a uniform pick
+        choices = np.flatnonzero(allowed)
+        return graph.walk_child(current, int(choices[rng.randrange(len(choices))]))
+    k = int(np.searchsorted(weights, rng.random() * weights[-1], side="right"))
+    return graph.walk_child(current, min(k, len(weights) - 1))
+
+
+def iter_walk(graph, start_name, target_progressions=100, close_loop=True, steer=True,
+              path=None, bank=None, rng=None, weighted=False):
+    """
+    Walk through the graph of progressions, yielding each step as it's chosen.
+
+    Every step is a :class:`WalkStep` holding the transposed snippet's
+    events, so a consumer (a live sequencer, a file writer, ...) can start
+    working after the first step. Nothing about earlier steps is kept
+    beyond the running transposition state, so memory stays constant
+    however long the walk runs.
+
+    With ``close_loop`` on, the walk follows random_walk's rules: it tries
+    to get back to start_name after roughly target_progressions steps (see
+    ``steer``) and stops there. With it off, the walk never stops by itself
+    and each step is drawn from the current node's children without
+    steering (uniformly, or by walk weight with ``weighted``); use
+    ``itertools.islice`` or break out of the loop to end it.
 
     Args:
-        arr_dict: Analysis dictionary from load_or_build_analysis
+        graph: ProgressionGraph (or a pruned analysis dictionary)
         start_name: Starting MIDI filename
         target_progressions: Target number of progressions to chain (approximate)
-        enable_playback: Enable realtime MIDI playback while generating
-        output_format: "lilypond" (default), "musicxml", or "show"
-        output_path: Path for output file (auto-generated if None)
-
-    Returns:
-        The generated Part with measures
+        close_loop: Stop once the walk is back at start_name
+        steer: Steer the walk so it returns to start_name in time
+        path: Explicit sequence of progressions to walk (start_name is ignored)
+        bank: Optional ProgressionBank holding every progression's snippet
+        rng: random.Random to draw steps from (default: the global ``random``)
+        weighted: Draw each step in proportion to the graph's walk weights
+            (see ProgressionGraph.set_walk_weights) instead of uniformly
+
+    Yields:
+        WalkStep tuples, one per progression
     """
-    if start_name not in arr_dict:
+    if not isinstance(graph, ProgressionGraph):
+        graph = ProgressionGraph.from_arr_dict(graph)
+    if rng is None:
+        rng = random
+
+    if path is not None:
+        path = [graph.node_id(p) if isinstance(p, str) else int(p) for p in path if p != -1]
+        if not path:
+            raise ValueError("Cannot render an empty path.")
+        start_name = graph.names[path[0]]
+        target_progressions = len(path)
+
+    if start_name not in graph:
         raise ValueError(f"Start file '{start_name}' not found in analysis.")
 
-    original_start = start_name
-    current_name = start_name
+    original_start = graph.node_id(start_name)
+    current = original_start
+    if close_loop:
+        # nodes from which original_start is a possible next step
+        leads_to_start = graph.walk_parents_mask(original_start)
+        # steps needed from each node to get back to original_start
+        dist = graph.walk_distances_to(original_start) if steer else None
 
     # soft bounds for "how long" the loop should be
-    min_steps = max(1, int(target_progressions * 0.75))
-    max_steps = max(min_steps + 1, int(target_progressions * 1.5))
+    min_steps, max_steps = walk_bounds(target_progressions)
+    if path is not None:
+        max_steps = len(path)
+    elif not close_loop:
+        max_steps = None
 
     transposer = 0
-    paper = []
-    part = stream.Part()
-    # set instrument for MuseScore (change to whatever you want)
-    part.insert(0, instrument.Viola())
+    octave_offset = 0
+    prev_end_soprano = None
+    offset = Fraction(0)
     num_steps = 0
 
-    for _ in range(max_steps):
-        name = current_name
+    while max_steps is None or num_steps < max_steps:
+        name = graph.names[current]
         num_steps += 1
 
-        print(name)
-
-        prog_stream = get_parsed(name)
-
-        # Try to take the first notated measure (1-based in music21).
-        # If that gives an empty slice, fall back to the whole stream.
-        c = prog_stream.measures(1, 1)
-        if len(c.recurse().notesAndRests) == 0:
-            c = prog_stream
-
         # normalization:
         # - on the very first snippet, transpose so that the outer voices
         #   (bass and soprano) are centered around middle C (MIDI 60).
         # - for later snippets, keep the older "bass → 48" heuristic.
-        bass = arr_dict[name]["first_chord"]["bass"]
-        soprano = arr_dict[name]["first_chord"]["soprano"]
+        bass = int(graph.first_bass[current])
+        soprano = int(graph.first_soprano[current])
 
         if num_steps == 1:
             midpoint = (bass + soprano) / 2.0
@@ -120,70 +280,206 @@ def random_walk(arr_dict, start_name, target_progressions=100, enable_playback=T
         else:
             normalizer = 48 - bass
 
-        end_soprano = arr_dict[name]["last_chord"]["soprano"] + transposer
-        begin_soprano = arr_dict[name]["first_chord"]["soprano"] + transposer
-
-        temp_list = (
-            name,
-            normalizer,
-            transposer,
-            begin_soprano + normalizer,
-            end_soprano + normalizer,
-        )
-        paper.append(temp_list)
-        li = range(len(paper))
-
-        # transpose + normalize
-        c = c.transpose(normalizer)
-        c = c.transpose(transposer)
-
-        transposer += arr_dict[name]["transposer"]
-        for i, item in enumerate(li):
-            if i > 0:
-                octave_check = paper[li[i - 1]][4] - paper[item][3]
-                c = c.transpose(octave_check)
-
-        # insert a text label with the snippet's name at its start
-        label = os.path.splitext(os.path.basename(name))[0]
-        current_offset = part.duration.quarterLength
-        txt = expressions.TextExpression(label)
-        part.insert(current_offset, txt)
-
-        # chordified stream – append chords/notes/rests directly to the Part
-        printout = c.chordify()
-        for el in printout.flat:
-            if isinstance(el, (chord.Chord, note.Note, note.Rest)):
-                part.append(el)
-
-        if enable_playback:
-            sp = midi.realtime.StreamPlayer(c)
-            sp.play()
-
-        # if we've come back to the starting progression after at least 2 steps
-        # and we're past the minimum suggested length, stop here
-        if num_steps > 1 and num_steps >= min_steps and name == original_start:
+        end_soprano = int(graph.last_soprano[current]) + transposer
+        begin_soprano = soprano + transposer
+
+        # octave correction: shift so this snippet's opening soprano picks up
+        # where the previous snippet's closing soprano left off. The shifts
+        # accumulate, so carry the running total instead of replaying history.
+        if prev_end_soprano is not None:
+            octave_offset += prev_end_soprano - (begin_soprano + normalizer)
+        prev_end_soprano = end_soprano + normalizer
+
+        shift = normalizer + transposer + octave_offset
+
+        # a node collapsed from duplicates renders one of them at random,
+        # moved down by however far above the kept progression it sits
+        aliases = graph.aliases_of(current)
+        if aliases:
+            k = rng.randrange(len(aliases) + 1)
+            if k:
+                name, alias_offset = aliases[k - 1]
+                shift -= alias_offset
+
+        if bank is not None:
+            # precompiled snippet: just shift the stored pitches
+            snippet = bank.snippet(name, shift)
+            elements = None
+        else:
+            # transpose + normalize + octave-correct in one go
+            elements = snippet_elements(first_measure(get_parsed(name)).transpose(shift))
+            snippet = [
+                (duration, np.array(pitches, dtype=np.int16), [TIE_TYPES[t] for t in ties])
+                for duration, pitches, ties in element_events(elements)
+            ]
+
+        step_offset = offset
+        events = []
+        for duration, pitches, ties in snippet:
+            events.append((float(offset), duration, pitches, ties))
+            # keep the timeline exact for tuplet durations like 1/3, as music21 does
+            offset += Fraction(duration).limit_denominator(65535)
+
+        yield WalkStep(num_steps - 1, current, name, float(step_offset), shift, events, elements)
+
+        transposer += int(graph.transposer[current])
+
+        if path is not None:
+            if num_steps < len(path):
+                current = path[num_steps]
+            continue
+
+        # with close_loop, if we've come back to the starting progression after at
+        # least 2 steps and we're past the minimum suggested length, stop here
+        if close_loop and num_steps > 1 and num_steps >= min_steps and current == original_start:
             break
 
         # otherwise, pick the next progression
-        children = arr_dict[name]["non_sink_children"]
-        if not children:
-            # total dead end: pick anything
-            candidates = list(arr_dict.keys())
+        n_children = graph.walk_degree(current)
+        if not n_children:
+            # total dead end: pick anything (original_start included)
+            can_close = True
+            candidates = np.arange(len(graph))
         else:
-            candidates = list(children)
-
-        # heuristic: once we've hit min_steps, if we *can* go to original_start next,
-        # bias toward that so we can close the loop.
-        if num_steps >= min_steps and original_start in candidates:
-            current_name = original_start
+            can_close = close_loop and leads_to_start[current]
+            candidates = graph.walk_children_of(current)
+
+        # heuristic: once we've hit min_steps, if we *can* go to original_start
+        # next, bias toward that so we can close the loop.
+        if close_loop and num_steps >= min_steps and can_close:
+            current = original_start
+            continue
+
+        # with steering, only steps from which the loop can still close in time
+        allowed = None
+        if close_loop and steer:
+            allowed = _steer_mask(current, candidates, dist, num_steps, min_steps, max_steps)
+
+        if weighted and n_children:
+            current = _weighted_step(graph, current, allowed, rng)
         else:
-            current_name = random.choice(candidates)
+            if allowed is not None:
+                candidates = candidates[allowed]
+            current = int(candidates[rng.randrange(len(candidates))])
+
+
+def random_walk(arr_dict, start_name, target_progressions=100, enable_playback=True,
+                output_format="lilypond", output_path=None, steer=True, path=None,
+                bank=None, playback=None, rng=None, verbose=True, weighted=False):
+    """
+    Walk through the graph of progressions and build a score.
+
+    We treat target_progressions as a *hint*:
+    - Try to get back to start_name after roughly that many steps.
+    - The final progression in the output is start_name again (so it's loopable).
+
+    With ``steer`` on, the walk uses precomputed shortest distances back to
+    start_name (a reverse BFS over the pruned graph): it only takes steps
+    from which the start is still reachable within the step budget, and
+    once past the minimum length it heads home along shortest paths. That
+    makes the loop close between 0.75x and 1.5x target_progressions whenever
+    the graph allows it.
+
+    Passing ``path`` (a sequence of node ids or names, e.g. one row of a
+    :func:`~concatenator.midi.batch.batch_walks` result) renders that path
+    instead of choosing steps at random.
+
+    With a :class:`~concatenator.midi.bank.ProgressionBank`, snippets come
+    from the precompiled bank and are only shifted, never parsed, sliced or
+    chordified.
+
+    The steps themselves come from :func:`iter_walk`; this collects them
+    into a single Part. Playback runs on a background thread
+    (:class:`~concatenator.midi.playback.RealtimePlayback`), so the walk
+    keeps computing ahead while earlier steps are still sounding.
+
+    Args:
+        arr_dict: Pruned analysis dictionary (after build_non_sink_children),
+            or a ProgressionGraph built from one
+        start_name: Starting MIDI filename
+        target_progressions: Target number of progressions to chain (approximate)
+        enable_playback: Enable realtime MIDI playback while generating
+        output_format: "lilypond" (default), "musicxml", or "show"
+        output_path: Path for output file (auto-generated if None)
+        steer: Steer the walk so it returns to start_name in time
+        path: Explicit sequence of progressions to render (start_name is ignored)
+        bank: Optional ProgressionBank holding every progression's snippet
+        playback: RealtimePlayback to play through when enable_playback is on
+            (default: a new one on the music21 realtime player); it is closed,
+            and drained, once the Part is built
+        rng: random.Random to draw steps from (default: the global ``random``)
+        verbose: Print each progression's name as it is chosen
+        weighted: Draw steps in proportion to the graph's walk weights
+
+    Returns:
+        The generated Part with measures
+    """
+    if not enable_playback:
+        playback = None
+    elif playback is None:
+        playback = RealtimePlayback()
+
+    steps = iter_walk(
+        arr_dict, start_name, target_progressions, steer=steer, path=path, bank=bank,
+        rng=rng, weighted=weighted,
+    )
+    return _part_from_steps(steps, playback, verbose)
+
+
+def _part_from_steps(steps, playback=None, verbose=False):
+    """Collect walk steps into a Part with measures, as random_walk does.
+
+    Args:
+        steps: Iterable of WalkStep (e.g. from iter_walk)
+        playback: Optional RealtimePlayback each step is submitted to; it is
+            closed, and drained, once the Part is built
+        verbose: Print each progression's name as it arrives
+
+    Returns:
+        The Part with measures
+    """
+    from music21 import expressions, instrument, stream
+
+    part = stream.Part()
+    # set instrument for MuseScore (change to whatever you want)
+    part.insert(0, instrument.Viola())
+
+    # close playback even if the walk fails or is interrupted; only a finished
+    # walk waits for the queued steps to play out
+    finished = False
+    try:
+        # notes that may still be tied to the next snippet's opening notes
+        open_notes = None
+        for step in steps:
+            if verbose:
+                print(step.name)
+
+            elements = step.elements
+            if elements is None:
+                elements = _elements_from_events(step.events)
+
+            # insert a text label with the snippet's name at its start
+            label = os.path.splitext(os.path.basename(step.name))[0]
+            current_offset = part.duration.quarterLength
+            txt = expressions.TextExpression(label)
+            part.insert(current_offset, txt)
+
+            # tie any immediately repeated notes (same MIDI pitch, back-to-back),
+            # including across the join with the previous snippet
+            open_notes = tie_repeated_notes(elements, current_offset, open_notes)
+
+            # chordified stream – append chords/notes/rests directly to the Part
+            for el in elements:
+                part.append(el)
 
-    # tie any immediately repeated notes (same MIDI pitch, back-to-back)
-    # do this on the raw Part, where all notes live directly in that stream
-    add_ties_for_repeated_notes(part)
+            if playback is not None:
+                playback.submit(step)
 
-    # now create measures so notation + MusicXML are valid
-    part_with_measures = part.makeMeasures()
+        # now create measures so notation + MusicXML are valid
+        part_with_measures = part.makeMeasures()
+        finished = True
+    finally:
+        if playback is not None:
+            playback.close(wait=finished)
 
     return part_with_measures